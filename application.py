@@ -1,38 +1,289 @@
-from typing import Dict
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Union
 import numpy as np
-from domain import Image, RGBColor, ColorPalette, ColorProcessingException
-from infrastructure import ColorAnalyzer
+from domain import (Image, RGBColor, ColorPalette, LabelMap, Project, DomainException, ColorProcessingException,
+                    JobCancelledException)
+from infrastructure import ColorAnalyzer, PaletteAssigner, PaletteCache, PngStripWriter, NpyStripWriter
+from instrumentation import Instrumentation
+from cleanup import LabelCleanup, clean_labels
+from frames import FrameReader, GifStreamWriter, VideoFrameWriter, RunningHistogram, match_order
+
+ProgressCallback = Callable[[str, float], None]
+PreviewCallback = Callable[[np.ndarray], None]
+ImageSink = Union[PngStripWriter, NpyStripWriter]
+FrameSink = Union[GifStreamWriter, VideoFrameWriter]
 
 class ColorReductionService:
     """Application service coordinating color reduction workflows"""
     
-    def __init__(self, color_analyzer: ColorAnalyzer):
+    PREVIEW_MAX_DIMENSION = 1200
+    THUMBNAIL_MAX_DIMENSION = 400
+    SWEEP_MAX_COLORS = 12
+    
+    def __init__(self, color_analyzer: ColorAnalyzer, palette_assigner: Optional[PaletteAssigner] = None,
+                 full_resolution: bool = False, palette_cache: Optional[PaletteCache] = None,
+                 instrumentation: Optional[Instrumentation] = None):
         self.color_analyzer = color_analyzer
+        self.palette_assigner = palette_assigner or PaletteAssigner()
+        self.full_resolution = full_resolution
+        self.palette_cache = palette_cache or PaletteCache()
+        # Shared with the analyzer unless given, so one sink sees every stage
+        self.instrumentation = instrumentation or color_analyzer.instrumentation
     
-    def auto_reduce_colors(self, image: Image, color_count: int) -> np.ndarray:
-        """Auto color reduction using K-means clustering"""
+    def auto_reduce_colors(self, image: Image, color_count: int,
+                           full_resolution: Optional[bool] = None, quantizer: Optional[str] = None,
+                           progress: Optional[ProgressCallback] = None, sweep: bool = False,
+                           preview: Optional[PreviewCallback] = None,
+                           sink: Optional[ImageSink] = None, preset: Optional[str] = None,
+                           dither: str = "none", cleanup: Optional[LabelCleanup] = None,
+                           shared_palette: Optional[ColorPalette] = None) -> Optional[np.ndarray]:
+        """Auto color reduction using K-means clustering or another quantizer backend"""
         try:
-            dominant_colors = self.color_analyzer.find_dominant_colors(image, color_count)
-            return self._apply_palette(image, dominant_colors)
+            with self.instrumentation.stage("auto_reduce_colors", pixels=image.total_pixels,
+                                            color_count=color_count, dither=dither):
+                if preview is not None:
+                    self._preview(image, color_count, quantizer, sweep, None, preview, preset=preset, dither=dither,
+                                  shared_palette=shared_palette)
+                dominant_colors = self._source_palette(image, color_count, quantizer, progress, sweep, preset,
+                                                       shared_palette)
+                return self._apply_palette(image, dominant_colors, full_resolution, progress, sink, dither, cleanup)
+        except JobCancelledException:
+            raise
         except Exception as e:
             raise ColorProcessingException(f"Auto reduction failed: {str(e)}")
     
-    def manual_reduce_colors(self, image: Image, filament_colors: ColorPalette) -> np.ndarray:
+    def manual_reduce_colors(self, image: Image, filament_colors: ColorPalette,
+                             full_resolution: Optional[bool] = None, quantizer: Optional[str] = None,
+                             progress: Optional[ProgressCallback] = None,
+                             preview: Optional[PreviewCallback] = None,
+                             sink: Optional[ImageSink] = None, metric: str = "rgb",
+                             preset: Optional[str] = None, dither: str = "none",
+                             cleanup: Optional[LabelCleanup] = None,
+                             shared_palette: Optional[ColorPalette] = None) -> Optional[np.ndarray]:
         """Reduce colors using specific filament colors with smart luminosity mapping"""
         try:
-            # Find natural color divisions in image
-            dominant_colors = self.color_analyzer.find_dominant_colors(image, len(filament_colors))
-            
-            # Create intelligent mapping based on luminosity
-            color_mapping = self._create_luminosity_mapping(dominant_colors, filament_colors)
-            
-            return self._apply_color_mapping(image, dominant_colors, color_mapping)
+            with self.instrumentation.stage("manual_reduce_colors", pixels=image.total_pixels,
+                                            color_count=len(filament_colors), metric=metric, dither=dither):
+                if preview is not None:
+                    self._preview(image, len(filament_colors), quantizer, False, filament_colors, preview, metric,
+                                  preset, dither, shared_palette)
+                
+                # Find natural color divisions in image
+                dominant_colors = self._source_palette(image, len(filament_colors), quantizer, progress,
+                                                       preset=preset, shared_palette=shared_palette)
+                
+                # Create intelligent mapping based on luminosity
+                color_mapping = self._create_luminosity_mapping(dominant_colors, filament_colors)
+                
+                return self._apply_color_mapping(image, dominant_colors, color_mapping, full_resolution, progress,
+                                                 sink, metric, dither, cleanup)
+        except JobCancelledException:
+            raise
         except Exception as e:
             raise ColorProcessingException(f"Manual reduction failed: {str(e)}")
     
-    def analyze_image_colors(self, image: Image, color_count: int) -> ColorPalette:
+    def auto_label_map(self, image: Image, color_count: int,
+                       full_resolution: Optional[bool] = None, quantizer: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None, sweep: bool = False,
+                       preset: Optional[str] = None, dither: str = "none",
+                       cleanup: Optional[LabelCleanup] = None,
+                       shared_palette: Optional[ColorPalette] = None) -> LabelMap:
+        """Per-pixel palette index behind auto_reduce_colors, for layer separation"""
+        try:
+            dominant_colors = self._source_palette(image, color_count, quantizer, progress, sweep, preset,
+                                                   shared_palette)
+            return self._layer_labels(image, dominant_colors, {}, full_resolution, progress, dither=dither,
+                                      cleanup=cleanup)
+        except JobCancelledException:
+            raise
+        except Exception as e:
+            raise ColorProcessingException(f"Layer separation failed: {str(e)}")
+    
+    def manual_label_map(self, image: Image, filament_colors: ColorPalette,
+                         full_resolution: Optional[bool] = None, quantizer: Optional[str] = None,
+                         progress: Optional[ProgressCallback] = None, metric: str = "rgb",
+                         preset: Optional[str] = None, dither: str = "none",
+                         cleanup: Optional[LabelCleanup] = None,
+                         shared_palette: Optional[ColorPalette] = None) -> LabelMap:
+        """Per-pixel filament index behind manual_reduce_colors, for layer separation"""
+        try:
+            dominant_colors = self._source_palette(image, len(filament_colors), quantizer, progress,
+                                                   preset=preset, shared_palette=shared_palette)
+            color_mapping = self._create_luminosity_mapping(dominant_colors, filament_colors)
+            return self._layer_labels(image, dominant_colors, color_mapping, full_resolution, progress, metric,
+                                      dither, cleanup)
+        except JobCancelledException:
+            raise
+        except Exception as e:
+            raise ColorProcessingException(f"Layer separation failed: {str(e)}")
+    
+    def create_project(self, image: Image, color_count: Optional[int] = None,
+                       filament_colors: Optional[ColorPalette] = None, full_resolution: Optional[bool] = None,
+                       quantizer: Optional[str] = None, sweep: bool = False, metric: str = "rgb",
+                       preset: Optional[str] = None, dither: str = "none",
+                       cleanup: Optional[LabelCleanup] = None,
+                       shared_palette: Optional[ColorPalette] = None) -> Project:
+        """Snapshot of a reduction for a project file; served from the caches right after a reduce"""
+        if full_resolution is None:
+            full_resolution = self.full_resolution
+        try:
+            if filament_colors is not None:
+                palette = self._source_palette(image, len(filament_colors), quantizer, preset=preset,
+                                               shared_palette=shared_palette)
+                mapping = self._create_luminosity_mapping(palette, filament_colors)
+            else:
+                palette = self._source_palette(image, color_count, quantizer, sweep=sweep, preset=preset,
+                                               shared_palette=shared_palette)
+                mapping = {}
+            palette_array, output_colors = self._palette_arrays(palette, mapping)
+            labels = self._label_map(image, palette_array, full_resolution, metric=metric, dither=dither,
+                                     cleanup=cleanup)
+            settings = {
+                'mode': "manual" if filament_colors is not None else "auto", 'color_count': len(palette),
+                'quantizer': quantizer or self.color_analyzer.quantizer,
+                'preset': preset or self.color_analyzer.preset, 'sweep': sweep, 'metric': metric,
+                'dither': dither, 'full_resolution': full_resolution,
+                'cleanup': cleanup.token if cleanup is not None and cleanup.enabled else None,
+                'shared_palette': shared_palette is not None,
+            }
+            return Project(labels, palette, ColorAnalyzer._to_palette(output_colors),
+                           self.palette_cache.fingerprint(image.pixels), image.file_path, settings)
+        except Exception as e:
+            raise ColorProcessingException(f"Project creation failed: {str(e)}")
+    
+    def project_label_map(self, project: Project) -> LabelMap:
+        """Layer label map of a reopened project, without the source image"""
+        return self._merge_labels(project.labels, self._palette_arrays(project.output_colors, {})[0])
+    
+    def render_project(self, project: Project) -> np.ndarray:
+        """Reduced image of a reopened project"""
+        return self._palette_arrays(project.output_colors, {})[0][project.labels]
+    
+    def analyze_image_colors(self, image: Image, color_count: int, quantizer: Optional[str] = None,
+                             progress: Optional[ProgressCallback] = None,
+                             preset: Optional[str] = None) -> ColorPalette:
         """Analyze and return dominant colors in image"""
-        return self.color_analyzer.find_dominant_colors(image, color_count)
+        palette = self._find_dominant_colors(image, color_count, quantizer, progress, preset=preset)
+        self._report(progress, "Done", 1.0)
+        return palette
+    
+    def sweep_palettes(self, image: Image, max_colors: int = SWEEP_MAX_COLORS, quantizer: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None,
+                       preset: Optional[str] = None) -> Dict[int, ColorPalette]:
+        """Palettes for every color count up to max_colors, fitted in one pass and cached per count"""
+        self._report(progress, "Sweeping color counts", 0.0)
+        palettes = self.color_analyzer.sweep_dominant_colors(image, max_colors, quantizer, preset)
+        for color_count, palette in palettes.items():
+            self.palette_cache.put(
+                self._palette_key(image, color_count, quantizer, sweep=True, preset=preset),
+                np.array([color.tuple for color in palette.colors], dtype=np.uint8)
+            )
+        return palettes
+    
+    def warm_sweep_labels(self, image: Image, max_colors: int = SWEEP_MAX_COLORS, quantizer: Optional[str] = None,
+                          full_resolution: Optional[bool] = None,
+                          progress: Optional[ProgressCallback] = None, preset: Optional[str] = None,
+                          dither: str = "none", cleanup: Optional[LabelCleanup] = None) -> None:
+        """Cache the label map of every swept color count so switching counts redisplays instantly"""
+        if full_resolution is None:
+            full_resolution = self.full_resolution
+        
+        for color_count in range(1, max_colors + 1):
+            palette = self._find_dominant_colors(image, color_count, quantizer, sweep=True, preset=preset)
+            palette_array = np.array([color.tuple for color in palette.colors], dtype=np.uint8)
+            self._label_map(image, palette_array, full_resolution, dither=dither, cleanup=cleanup)
+            self._report(progress, "Preparing color counts", color_count / max_colors)
+    
+    def color_histogram(self, image: Image) -> RunningHistogram:
+        """Color histogram of the analysis downsample, to be merged with other images' for a shared palette"""
+        analyzer = self.color_analyzer
+        histogram = RunningHistogram(analyzer.histogram_bits)
+        with self.instrumentation.stage("histogram", pixels=image.total_pixels):
+            histogram.add(analyzer._prepare_image(image, analyzer.analysis_max_dimension).pixels)
+        return histogram
+    
+    def fit_shared_palette(self, histogram: RunningHistogram, color_count: int, quantizer: Optional[str] = None,
+                           preset: Optional[str] = None) -> ColorPalette:
+        """One palette for a batch, fitted on the merged histograms of all its images"""
+        colors, counts = histogram.colors()
+        if len(colors) == 0:
+            raise ColorProcessingException("No colors collected for a shared palette")
+        with self.instrumentation.stage("fit_shared_palette", color_count=color_count, distinct_colors=len(colors)):
+            return self.color_analyzer.fit_histogram(colors, counts, color_count, quantizer, preset)
+    
+    @staticmethod
+    def _report(progress: Optional[ProgressCallback], stage: str, fraction: float) -> None:
+        """Forward stage progress; the callback may raise JobCancelledException"""
+        if progress is not None:
+            progress(stage, fraction)
+    
+    def _palette_key(self, image: Image, color_count: int, quantizer: Optional[str], sweep: bool,
+                     preset: Optional[str] = None) -> str:
+        """Sweep palettes are warm-started, so they are cached apart from independent fits"""
+        return self.palette_cache.key(
+            "palette", self.palette_cache.fingerprint(image.pixels),
+            color_count, self.color_analyzer.cache_token(quantizer, preset), "sweep" if sweep else "single"
+        )
+    
+    def _cached_palette(self, image: Image, color_count: int, quantizer: Optional[str],
+                        sweep: bool, preset: Optional[str] = None) -> Optional[ColorPalette]:
+        cached = self.palette_cache.get(self._palette_key(image, color_count, quantizer, sweep, preset))
+        if cached is None:
+            return None
+        return ColorPalette(tuple(RGBColor.from_tuple(tuple(map(int, color))) for color in cached))
+    
+    def _find_dominant_colors(self, image: Image, color_count: int, quantizer: Optional[str] = None,
+                              progress: Optional[ProgressCallback] = None, sweep: bool = False,
+                              preset: Optional[str] = None) -> ColorPalette:
+        """Fit the palette once per image content and analysis settings"""
+        self._report(progress, "Analyzing colors", 0.0)
+        cached = self._cached_palette(image, color_count, quantizer, sweep, preset)
+        if cached is not None:
+            self.instrumentation.event("cache_hit", cache="palette", color_count=color_count)
+            return cached
+        
+        key = self._palette_key(image, color_count, quantizer, sweep, preset)
+        if sweep:
+            max_colors = max(color_count, self.SWEEP_MAX_COLORS)
+            return self.sweep_palettes(image, max_colors, quantizer, progress, preset)[color_count]
+        
+        palette = self.color_analyzer.find_dominant_colors(image, color_count, quantizer, preset)
+        self.palette_cache.put(key, np.array([color.tuple for color in palette.colors], dtype=np.uint8))
+        return palette
+    
+    def _source_palette(self, image: Image, color_count: int, quantizer: Optional[str] = None,
+                        progress: Optional[ProgressCallback] = None, sweep: bool = False,
+                        preset: Optional[str] = None, shared_palette: Optional[ColorPalette] = None) -> ColorPalette:
+        """The palette fitted across a batch when given, otherwise the image's own"""
+        if shared_palette is not None:
+            return shared_palette
+        return self._find_dominant_colors(image, color_count, quantizer, progress, sweep, preset)
+    
+    def _preview(self, image: Image, color_count: int, quantizer: Optional[str], sweep: bool,
+                 filament_colors: Optional[ColorPalette], preview: PreviewCallback, metric: str = "rgb",
+                 preset: Optional[str] = None, dither: str = "none",
+                 shared_palette: Optional[ColorPalette] = None) -> None:
+        """Publish a thumbnail-resolution result before the full-resolution work starts"""
+        with self.instrumentation.stage("preview", color_count=color_count):
+            thumbnail = Image(image.file_path,
+                              self.color_analyzer.create_thumbnail(image.pixels, self.THUMBNAIL_MAX_DIMENSION))
+            
+            # Reuse the final palette when it is already known, otherwise fit a quick one on the thumbnail
+            palette = shared_palette or self._cached_palette(image, color_count, quantizer, sweep, preset)
+            if palette is None:
+                palette = self.color_analyzer.find_dominant_colors(thumbnail, color_count, quantizer, preset)
+            
+            mapping = {} if filament_colors is None else self._create_luminosity_mapping(palette, filament_colors)
+            palette_array, output_colors = self._palette_arrays(palette, mapping)
+            if dither == "none":
+                # A throwaway palette is not worth a lookup table; thumbnails are cheap to assign directly
+                labels = self.palette_assigner.assign_labels(thumbnail.pixels, palette_array, metric)
+            else:
+                labels = self.palette_assigner.label_map(thumbnail.pixels, palette_array, metric=metric, dither=dither)
+            result = output_colors[labels]
+        preview(result)
     
     def _create_luminosity_mapping(self, source: ColorPalette, target: ColorPalette) -> Dict[RGBColor, RGBColor]:
         """Smart mapping: darkest source → darkest target, etc."""
@@ -47,29 +298,267 @@ class ColorReductionService:
         
         return mapping
     
-    def _apply_palette(self, image: Image, palette: ColorPalette) -> np.ndarray:
+    def _apply_palette(self, image: Image, palette: ColorPalette,
+                       full_resolution: Optional[bool] = None,
+                       progress: Optional[ProgressCallback] = None,
+                       sink: Optional[ImageSink] = None, dither: str = "none",
+                       cleanup: Optional[LabelCleanup] = None) -> Optional[np.ndarray]:
         """Apply color palette to image"""
-        return self._apply_color_mapping(image, palette, {})
+        return self._apply_color_mapping(image, palette, {}, full_resolution, progress, sink, dither=dither,
+                                         cleanup=cleanup)
     
-    def _apply_color_mapping(self, image: Image, palette: ColorPalette, mapping: Dict[RGBColor, RGBColor]) -> np.ndarray:
-        """Core algorithm: map each pixel to closest color with optional mapping"""
-        processed_image = self.color_analyzer._prepare_image(image, max_dimension=1200)
-        pixels = processed_image.pixels.reshape(-1, 3)
+    def _apply_color_mapping(self, image: Image, palette: ColorPalette, mapping: Dict[RGBColor, RGBColor],
+                             full_resolution: Optional[bool] = None,
+                             progress: Optional[ProgressCallback] = None,
+                             sink: Optional[ImageSink] = None, metric: str = "rgb",
+                             dither: str = "none", cleanup: Optional[LabelCleanup] = None) -> Optional[np.ndarray]:
+        """Core algorithm: map each pixel to closest color (RGB or perceptual metric) with optional mapping"""
+        if full_resolution is None:
+            full_resolution = self.full_resolution
         
-        # Convert palette to numpy for distance calculation
-        palette_array = np.array([color.tuple for color in palette.colors])
+        palette_array, output_colors = self._palette_arrays(palette, mapping)
+        if sink is not None:
+            if cleanup is not None and cleanup.enabled:
+                # Cleanup needs whole regions, so the label map is built first and written out in strips
+                labels = self._label_map(image, palette_array, True, progress, metric, dither, cleanup)
+                write_rows = self._sink_writer(sink, output_colors)
+                rows = self.palette_assigner.tile_rows(labels.shape[1], len(palette_array))
+                for top in range(0, len(labels), rows):
+                    write_rows(labels[top:top + rows])
+            else:
+                self._stream_to_sink(image, palette_array, output_colors, sink, progress, metric, dither)
+            return None
         
-        # Find closest palette color for each pixel
-        distances = np.linalg.norm(pixels[:, None] - palette_array[None, :], axis=2)
-        labels = np.argmin(distances, axis=1)
+        labels = self._label_map(image, palette_array, full_resolution, progress, metric, dither, cleanup)
+        with self.instrumentation.stage("recolor", pixels=labels.size):
+            result = output_colors[labels]
+        self._report(progress, "Done", 1.0)
+        return result
+    
+    def _layer_labels(self, image: Image, palette: ColorPalette, mapping: Dict[RGBColor, RGBColor],
+                      full_resolution: Optional[bool] = None,
+                      progress: Optional[ProgressCallback] = None, metric: str = "rgb",
+                      dither: str = "none", cleanup: Optional[LabelCleanup] = None) -> LabelMap:
+        """Label map over output colors; palette entries mapped to the same filament share a label"""
+        if full_resolution is None:
+            full_resolution = self.full_resolution
         
-        # Apply color mapping
-        reduced_pixels = np.zeros_like(pixels)
-        for i, label in enumerate(labels):
-            original_color = palette.colors[label]
-            if original_color in mapping:
-                reduced_pixels[i] = mapping[original_color].tuple
-            else:
-                reduced_pixels[i] = original_color.tuple
+        palette_array, output_colors = self._palette_arrays(palette, mapping)
+        labels = self._label_map(image, palette_array, full_resolution, progress, metric, dither, cleanup)
+        self._report(progress, "Done", 1.0)
+        return self._merge_labels(labels, output_colors)
+    
+    @staticmethod
+    def _merge_table(output_colors: np.ndarray):
+        """Label → merged label table and the distinct output colors, in first-appearance order"""
+        _, first, inverse = np.unique(output_colors, axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return rank[inverse.ravel()].astype(np.uint8), output_colors[first[order]]
+    
+    @classmethod
+    def _merge_labels(cls, labels: np.ndarray, output_colors: np.ndarray) -> LabelMap:
+        """Label map over output colors; palette entries mapped to the same filament share a label"""
+        table, colors = cls._merge_table(output_colors)
+        if len(colors) < len(output_colors):
+            # Relabel through a K-entry table
+            labels = table[labels]
+        return LabelMap(labels, ColorAnalyzer._to_palette(colors))
+    
+    @classmethod
+    def _sink_writer(cls, sink: ImageSink, output_colors: np.ndarray) -> Callable[[np.ndarray], None]:
+        """Writes label rows to the sink: palette indices for an indexed PNG, otherwise their colors"""
+        if getattr(sink, 'indexed', False):
+            # Palettized output: one byte per pixel, the distinct output colors as the palette
+            table, colors = cls._merge_table(output_colors)
+            sink.write_palette(colors)
+            return lambda labels: sink.write_rows(table[labels])
+        return lambda labels: sink.write_rows(output_colors[labels])
+    
+    def _stream_to_sink(self, image: Image, palette_array: np.ndarray, output_colors: np.ndarray,
+                        sink: ImageSink, progress: Optional[ProgressCallback] = None,
+                        metric: str = "rgb", dither: str = "none") -> None:
+        """Write the source-resolution result tile by tile; neither labels nor output are held whole"""
+        height = image.dimensions[0]
+        self._report(progress, "Assigning colors", 0.0)
+        with self.instrumentation.stage("stream_to_sink", pixels=image.total_pixels,
+                                        color_count=len(palette_array), metric=metric, dither=dither):
+            write_rows = self._sink_writer(sink, output_colors)
+            for top, tile_labels in self.palette_assigner.iter_label_tiles(image.pixels, palette_array, metric,
+                                                                           dither):
+                write_rows(tile_labels)
+                self._report(progress, "Assigning colors", (top + len(tile_labels)) / height)
+        self._report(progress, "Done", 1.0)
+    
+    @staticmethod
+    def _palette_arrays(palette: ColorPalette, mapping: Dict[RGBColor, RGBColor]):
+        """Palette for distance calculation and the output color of every palette entry"""
+        palette_array = np.array([color.tuple for color in palette.colors], dtype=np.uint8)
+        
+        # Resolve label → output color once instead of per pixel
+        output_colors = np.array(
+            [mapping.get(color, color).tuple for color in palette.colors], dtype=np.uint8
+        )
+        return palette_array, output_colors
+    
+    def _label_map(self, image: Image, palette_array: np.ndarray, full_resolution: bool,
+                   progress: Optional[ProgressCallback] = None, metric: str = "rgb",
+                   dither: str = "none", cleanup: Optional[LabelCleanup] = None) -> np.ndarray:
+        """Palette index per output pixel, reused across runs on the same image, palette, metric and dither"""
+        if cleanup is not None and cleanup.enabled:
+            return self._cleaned_label_map(image, palette_array, full_resolution, progress, metric, dither, cleanup)
+        
+        key = self.palette_cache.key(
+            "labels", self.palette_cache.fingerprint(image.pixels),
+            palette_array.tobytes().hex(), full_resolution, metric, dither
+        )
+        labels = self.palette_cache.get(key)
+        if labels is not None:
+            self.instrumentation.event("cache_hit", cache="labels", color_count=len(palette_array))
+            return labels
         
-        return reduced_pixels.reshape(processed_image.pixels.shape)
\ No newline at end of file
+        # Palette is learned on a downsample; full-resolution output assigns the original pixels tile by tile
+        if full_resolution:
+            processed_image = image
+        else:
+            processed_image = self.color_analyzer._prepare_image(image, max_dimension=self.PREVIEW_MAX_DIMENSION)
+        
+        self._report(progress, "Assigning colors", 0.0)
+        with self.instrumentation.stage("assign_colors", pixels=processed_image.total_pixels,
+                                        color_count=len(palette_array), metric=metric, dither=dither):
+            labels = self.palette_assigner.label_map(
+                processed_image.pixels, palette_array,
+                None if progress is None else lambda fraction: progress("Assigning colors", fraction),
+                metric, dither
+            )
+        self.palette_cache.put(key, labels)
+        return labels
+    
+    def _cleaned_label_map(self, image: Image, palette_array: np.ndarray, full_resolution: bool,
+                           progress: Optional[ProgressCallback], metric: str, dither: str,
+                           cleanup: LabelCleanup) -> np.ndarray:
+        """Printability cleanup on top of the cached raw label map, so toggling it never reassigns pixels"""
+        key = self.palette_cache.key(
+            "cleaned", self.palette_cache.fingerprint(image.pixels),
+            palette_array.tobytes().hex(), full_resolution, metric, dither, cleanup.token
+        )
+        labels = self.palette_cache.get(key)
+        if labels is not None:
+            self.instrumentation.event("cache_hit", cache="cleaned", color_count=len(palette_array))
+            return labels
+        
+        labels = self._label_map(image, palette_array, full_resolution, progress, metric, dither)
+        self._report(progress, "Cleaning up", 0.0)
+        with self.instrumentation.stage("cleanup", pixels=labels.size, color_count=len(palette_array),
+                                        mode_size=cleanup.mode_size, min_feature=cleanup.min_feature,
+                                        min_region=cleanup.min_region):
+            labels = clean_labels(labels, len(palette_array), cleanup)
+        self.palette_cache.put(key, labels)
+        return labels
+
+class ClipReductionService:
+    """Reduces animated GIFs and videos frame by frame against one shared (or slowly refitted) palette"""
+    
+    def __init__(self, color_service: ColorReductionService, max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        self.color_service = color_service
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        # Frames decoded ahead of the encoder; bounds memory independently of the clip length
+        self.max_pending = max_pending or 2 * self.max_workers
+    
+    def reduce_clip(self, reader: FrameReader, sink: FrameSink, color_count: Optional[int] = None,
+                    filament_colors: Optional[ColorPalette] = None, quantizer: Optional[str] = None,
+                    preset: Optional[str] = None, metric: str = "rgb", refit_interval: Optional[int] = None,
+                    decay: float = 0.5, progress: Optional[ProgressCallback] = None,
+                    dither: str = "none", shared_palette: Optional[ColorPalette] = None) -> ColorPalette:
+        """Write every frame reduced to color_count colors or onto filament_colors; returns the final palette
+        
+        Without refit_interval the palette is fitted once from a histogram of the whole clip (two decoding
+        passes). With it, a single pass refits every refit_interval frames from a histogram in which older
+        frames fade by decay, keeping each color in its slot so layers stay stable. A shared_palette fitted
+        across a batch is used as is, in a single pass.
+        """
+        if (color_count is None) == (filament_colors is None):
+            raise ColorProcessingException("Give either a color count or filament colors")
+        color_count = color_count or len(filament_colors)
+        service = self.color_service
+        histogram = RunningHistogram(service.color_analyzer.histogram_bits)
+        
+        try:
+            with service.instrumentation.stage("reduce_clip", frames=reader.frame_count, color_count=color_count,
+                                               refit_interval=refit_interval):
+                arrays = None
+                if shared_palette is not None:
+                    arrays = self._arrays(shared_palette, filament_colors)
+                    refit_interval = None
+                elif refit_interval is None:
+                    histogram = self.color_histogram(reader, progress)
+                    arrays = self._fit(histogram, color_count, filament_colors, quantizer, preset, None)
+                
+                pending = deque()
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    for index, (pixels, duration) in enumerate(reader):
+                        if refit_interval is not None:
+                            histogram.add(self._analysis_pixels(reader, pixels))
+                            if index % refit_interval == 0:
+                                previous = None if arrays is None else arrays[0]
+                                arrays = self._fit(histogram, color_count, filament_colors, quantizer, preset,
+                                                   previous)
+                                histogram.decay(decay)
+                        
+                        palette_array, output_colors = arrays
+                        pending.append((pool.submit(service.palette_assigner.label_map, pixels, palette_array,
+                                                    metric=metric, dither=dither), output_colors, duration))
+                        if len(pending) >= self.max_pending:
+                            self._write_next(pending, sink)
+                        self._progress(progress, "Reducing frames", index, reader.frame_count)
+                    while pending:
+                        self._write_next(pending, sink)
+            
+            self._progress(progress, "Done", 1, 1)
+            return ColorPalette(tuple(RGBColor.from_tuple(tuple(map(int, color))) for color in arrays[1]))
+        except DomainException:
+            raise
+        except Exception as e:
+            raise ColorProcessingException(f"Clip reduction failed: {str(e)}")
+    
+    def color_histogram(self, reader: FrameReader, progress: Optional[ProgressCallback] = None) -> RunningHistogram:
+        """Histogram of every frame's analysis downsample"""
+        histogram = RunningHistogram(self.color_service.color_analyzer.histogram_bits)
+        for index, (pixels, _) in enumerate(reader):
+            histogram.add(self._analysis_pixels(reader, pixels))
+            self._progress(progress, "Collecting colors", index, reader.frame_count)
+        return histogram
+    
+    def _analysis_pixels(self, reader: FrameReader, pixels: np.ndarray) -> np.ndarray:
+        """Frame downsampled as for still-image analysis"""
+        analyzer = self.color_service.color_analyzer
+        return analyzer._prepare_image(Image(reader.file_path, pixels), analyzer.analysis_max_dimension).pixels
+    
+    def _fit(self, histogram: RunningHistogram, color_count: int, filament_colors: Optional[ColorPalette],
+             quantizer: Optional[str], preset: Optional[str], previous: Optional[np.ndarray]):
+        """Palette and output color arrays from the histogram, in the slot order of the previous palette"""
+        service = self.color_service
+        colors, counts = histogram.colors()
+        palette = service.color_analyzer.fit_histogram(colors, counts, color_count, quantizer, preset)
+        palette_array = match_order(previous, np.array([color.tuple for color in palette.colors], dtype=np.uint8))
+        palette = ColorPalette(tuple(RGBColor.from_tuple(tuple(map(int, color))) for color in palette_array))
+        return self._arrays(palette, filament_colors)
+    
+    def _arrays(self, palette: ColorPalette, filament_colors: Optional[ColorPalette]):
+        """Palette and output color arrays, mapped onto the filaments when given"""
+        service = self.color_service
+        mapping = {} if filament_colors is None else service._create_luminosity_mapping(palette, filament_colors)
+        return service._palette_arrays(palette, mapping)
+    
+    @staticmethod
+    def _write_next(pending: deque, sink: FrameSink) -> None:
+        """Encode the oldest frame; frames leave in decoding order whatever order workers finish in"""
+        future, output_colors, duration = pending.popleft()
+        sink.write_frame(future.result(), output_colors, duration)
+    
+    @staticmethod
+    def _progress(progress: Optional[ProgressCallback], stage: str, index: int, total: int) -> None:
+        if progress is not None:
+            progress(stage, min(1.0, (index + 1) / total) if total else 0.0)
\ No newline at end of file
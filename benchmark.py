@@ -0,0 +1,257 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from domain import Image
+from infrastructure import ColorAnalyzer, ImageRepository, PaletteAssigner, PaletteCache
+from application import ColorReductionService
+from quantizers import preload_backends
+
+DEFAULT_MEGAPIXELS = [0.5, 2.0, 8.0, 20.0, 50.0]
+DEFAULT_COLORS = [2, 6, 12]
+SYNTHETIC_IMAGES = ["gradient", "noise", "photo"]
+STAGES = ["startup", "prepare_image", "find_dominant_colors", "apply_color_mapping"]
+STARTUP_SCRIPT = "import time; started = time.perf_counter(); import interface; print(time.perf_counter() - started)"
+
+def image_shape(megapixels: float) -> Tuple[int, int]:
+    """Height and width of a 4:3 image with about this many megapixels"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    return max(1, int(round(width * 3 / 4))), max(1, width)
+
+def synthetic_image(kind: str, megapixels: float, seed: int = 0) -> np.ndarray:
+    """Reproducible test image: smooth gradient, uniform noise or a photo-like scene"""
+    height, width = image_shape(megapixels)
+    rng = np.random.default_rng(seed)
+    
+    if kind == "noise":
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    if kind == "gradient":
+        return np.stack([
+            np.broadcast_to(x * 255, (height, width)),
+            np.broadcast_to(y * 255, (height, width)),
+            (x + y) * 127.5,
+        ], axis=-1).astype(np.uint8)
+    
+    if kind == "photo":
+        # Soft colored blobs over a sky-like gradient, with sensor noise and hard-edged shapes
+        small = rng.random((max(2, height // 64), max(2, width // 64), 3), dtype=np.float32)
+        blobs = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        base = np.empty((height, width, 3), dtype=np.float32)
+        base[..., 0] = 60 + 120 * y
+        base[..., 1] = 90 + 100 * y
+        base[..., 2] = 200 - 80 * y
+        image = 0.55 * base + 0.45 * 255 * np.clip(blobs, 0, 1)
+        for _ in range(12):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            radius = int(rng.integers(1, max(2, min(height, width) // 6)))
+            cv2.circle(image, center, radius, tuple(float(v) for v in rng.integers(0, 256, 3)), -1)
+        image += rng.normal(0, 4, (height, width, 3)).astype(np.float32)
+        return np.clip(image, 0, 255).astype(np.uint8)
+    
+    raise ValueError(f"Unknown synthetic image '{kind}'. Available: {', '.join(SYNTHETIC_IMAGES)}")
+
+def resized_image(pixels: np.ndarray, megapixels: float) -> np.ndarray:
+    """A real image scaled to the requested size"""
+    height, width = pixels.shape[:2]
+    scale = (megapixels * 1e6 / (height * width)) ** 0.5
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(pixels, size, interpolation=interpolation)
+
+def stage_runner(stage: str, image: Image, color_count: int) -> Callable[[], object]:
+    """Callable that runs one stage cold: fresh services, so no cache or lookup table is reused"""
+    if stage == "prepare_image":
+        analyzer = ColorAnalyzer()
+        return lambda: analyzer._prepare_image(image, max_dimension=analyzer.analysis_max_dimension)
+    
+    if stage == "find_dominant_colors":
+        return lambda: ColorAnalyzer().find_dominant_colors(image, color_count)
+    
+    if stage == "apply_color_mapping":
+        palette = ColorAnalyzer().find_dominant_colors(image, color_count)
+        
+        def apply():
+            service = ColorReductionService(ColorAnalyzer(), PaletteAssigner(), palette_cache=PaletteCache())
+            return service._apply_color_mapping(image, palette, {}, full_resolution=True)
+        return apply
+    
+    raise ValueError(f"Unknown stage '{stage}'. Available: {', '.join(STAGES)}")
+
+def measure(run: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Wall times over several runs, then peak traced allocation from one extra run"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    
+    # Traced separately so tracemalloc overhead does not distort the timings
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'seconds': statistics.median(times),
+        'min_seconds': min(times),
+        'peak_mb': peak / (1024 * 1024),
+    }
+
+def measure_startup(repeat: int) -> dict:
+    """Import time of the GUI module in a fresh interpreter, including numpy and OpenCV but not scikit-learn"""
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=Path(__file__).resolve().parent,
+                                capture_output=True, text=True, check=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return {
+        'image': "-", 'megapixels': 0.0, 'actual_megapixels': 0.0, 'colors': None, 'stage': "startup",
+        'seconds': statistics.median(times), 'min_seconds': min(times), 'peak_mb': 0.0, 'mp_per_s': 0.0,
+    }
+
+def run_suite(images: List[str], megapixels: List[float], colors: List[int], stages: List[str],
+              repeat: int, log: Callable[[str], None] = print) -> List[dict]:
+    """Benchmark every image × size × color count × stage combination"""
+    repository = ImageRepository()
+    results = []
+    if "startup" in stages:
+        results.append(measure_startup(repeat))
+        log(format_record(results[-1]))
+    stages = [stage for stage in stages if stage != "startup"]
+    # Library import time belongs to the startup metric, not to the first fit
+    preload_backends()
+    
+    for name in images:
+        source = None if name in SYNTHETIC_IMAGES else repository.load(Path(name)).pixels
+        for size in megapixels:
+            pixels = synthetic_image(name, size) if source is None else resized_image(source, size)
+            image = Image(Path(name), pixels)
+            actual_megapixels = image.total_pixels / 1e6
+            
+            for color_count in colors:
+                for stage in stages:
+                    # prepare_image does not depend on the color count
+                    if stage == "prepare_image" and color_count != colors[0]:
+                        continue
+                    stats = measure(stage_runner(stage, image, color_count), repeat)
+                    record = {
+                        'image': Path(name).name, 'megapixels': size, 'actual_megapixels': actual_megapixels,
+                        'colors': color_count if stage != "prepare_image" else None, 'stage': stage,
+                        **stats, 'mp_per_s': actual_megapixels / stats['seconds'] if stats['seconds'] else 0.0,
+                    }
+                    results.append(record)
+                    log(format_record(record))
+    return results
+
+def format_record(record: dict) -> str:
+    colors = "-" if record['colors'] is None else record['colors']
+    return (f"{record['image']:>12} {record['megapixels']:>6.1f} MP {colors:>3} colors "
+            f"{record['stage']:<22} {record['seconds'] * 1000:>9.1f} ms "
+            f"{record['mp_per_s']:>8.1f} MP/s {record['peak_mb']:>8.1f} MB peak")
+
+def record_key(record: dict) -> Tuple:
+    return record['image'], record['megapixels'], record['colors'], record['stage']
+
+def compare(results: List[dict], baseline: List[dict], time_threshold: float,
+            memory_threshold: float) -> List[str]:
+    """Describe every case that got slower or hungrier than the baseline allows
+    
+    Time compares the fastest run of each case: scheduling and cache noise only ever adds time, so the minimum
+    is far steadier than the median, and a slower minimum means every repeat was slower.
+    """
+    previous = {record_key(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        old = previous.get(record_key(record))
+        if old is None:
+            continue
+        old_seconds = old.get('min_seconds', old['seconds'])
+        new_seconds = record['min_seconds']
+        time_ratio = new_seconds / old_seconds if old_seconds else 1.0
+        memory_ratio = record['peak_mb'] / old['peak_mb'] if old['peak_mb'] else 1.0
+        problems = []
+        if time_ratio > 1 + time_threshold:
+            problems.append(f"fastest run {old_seconds * 1000:.1f} → {new_seconds * 1000:.1f} ms "
+                            f"(+{(time_ratio - 1):.0%})")
+        if memory_ratio > 1 + memory_threshold:
+            problems.append(f"peak {old['peak_mb']:.1f} → {record['peak_mb']:.1f} MB (+{(memory_ratio - 1):.0%})")
+        if problems:
+            colors = "-" if record['colors'] is None else record['colors']
+            regressions.append(f"{record['image']} {record['megapixels']} MP {colors} colors "
+                               f"{record['stage']}: {'; '.join(problems)}")
+    return regressions
+
+def environment() -> dict:
+    import sklearn
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'scikit-learn': sklearn.__version__,
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Benchmark the analysis and color assignment hot paths",
+    )
+    parser.add_argument('--images', nargs='+', default=SYNTHETIC_IMAGES,
+                        help=f"Synthetic images ({', '.join(SYNTHETIC_IMAGES)}) or image files")
+    parser.add_argument('--megapixels', nargs='+', type=float, default=DEFAULT_MEGAPIXELS,
+                        help="Image sizes in megapixels")
+    parser.add_argument('--colors', nargs='+', type=int, default=DEFAULT_COLORS, help="Color counts (1-12)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to measure")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (median is reported)")
+    parser.add_argument('--output', type=Path, help="Write results as JSON")
+    parser.add_argument('--baseline', type=Path, help="Compare against a previous JSON result")
+    parser.add_argument('--time-threshold', type=float, default=0.25,
+                        help="Allowed slowdown of the fastest run vs the baseline (default: 0.25 = 25%%)")
+    parser.add_argument('--memory-threshold', type=float, default=0.20,
+                        help="Allowed peak memory growth vs the baseline (default: 0.20 = 20%%)")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the suite; exit code 1 when the baseline comparison finds regressions"""
+    args = build_parser().parse_args(argv)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as handle:
+            baseline = json.load(handle)['results']
+    
+    results = run_suite(args.images, args.megapixels, args.colors, args.stages, max(1, args.repeat))
+    
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump({'environment': environment(), 'results': results}, handle, indent=2)
+        print(f"Results written to {args.output}")
+    
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    print(f"{len(regressions)} regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
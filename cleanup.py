@@ -0,0 +1,209 @@
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+
+MM_PER_INCH = 25.4
+STRIP_PIXELS = 4 * 1024 * 1024  # Pixels per strip of the tiled passes
+
+@dataclass(frozen=True)
+class LabelCleanup:
+    """Printability cleanup of a label map; every step is off at its default"""
+    mode_size: int = 0      # Majority filter window in pixels (odd)
+    min_feature: int = 0    # Remove parts narrower than this many pixels
+    min_region: int = 0     # Merge regions smaller than this many pixels into their dominant neighbour
+    
+    @property
+    def enabled(self) -> bool:
+        return self.mode_size > 1 or self.min_feature > 1 or self.min_region > 1
+    
+    @property
+    def token(self) -> str:
+        """Cache key part"""
+        return f"mode={self.mode_size}:feature={self.min_feature}:region={self.min_region}"
+    
+    @classmethod
+    def for_print(cls, min_feature_mm: float = 0.0, pixel_size: Optional[float] = None,
+                  dpi: Optional[float] = None, mode_size: int = 0, min_region: int = 0) -> 'LabelCleanup':
+        """Settings with the minimum feature given in mm at a pixel size (mm per pixel) or print DPI"""
+        min_feature = 0
+        if min_feature_mm > 0:
+            if pixel_size is None:
+                if dpi is None:
+                    raise ValueError("A minimum feature size in mm needs a pixel size or a print DPI")
+                pixel_size = MM_PER_INCH / dpi
+            min_feature = math.ceil(min_feature_mm / pixel_size)
+        return cls(mode_size=mode_size, min_feature=min_feature, min_region=min_region)
+
+# Settings behind the GUI's cleanup checkbox
+DEFAULT_CLEANUP = LabelCleanup(mode_size=3, min_region=16)
+
+def strip_bincount(values: np.ndarray, minlength: int) -> np.ndarray:
+    """np.bincount in strips: it widens its input to 8-byte integers, which whole-map would cost 8 bytes per pixel"""
+    flat = values.reshape(-1)
+    counts = np.zeros(minlength, dtype=np.int64)
+    for start in range(0, flat.size, STRIP_PIXELS):
+        counts += np.bincount(flat[start:start + STRIP_PIXELS], minlength=minlength)
+    return counts
+
+def strip_take(table: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """table[index] over row strips of a 2-D index, which is widened to 8-byte integers the same way"""
+    result = np.empty(index.shape, dtype=table.dtype)
+    rows = max(1, STRIP_PIXELS // max(1, index.shape[1]))
+    for top in range(0, len(index), rows):
+        result[top:top + rows] = table[index[top:top + rows]]
+    return result
+
+def present_labels(labels: np.ndarray, color_count: int) -> List[int]:
+    counts = strip_bincount(labels, color_count)
+    return [int(label) for label in np.flatnonzero(counts)]
+
+def mode_filter(labels: np.ndarray, color_count: int, size: int = 3) -> np.ndarray:
+    """Majority filter: each pixel takes the most frequent label in its window, keeping its own on ties
+    
+    Runs in row strips, so memory beyond the output stays bounded whatever the map size.
+    """
+    if size <= 1:
+        return labels
+    height, width = labels.shape
+    radius = size // 2
+    present = present_labels(labels, color_count)
+    result = np.empty_like(labels)
+    rows = max(1, STRIP_PIXELS // max(1, width))
+    
+    for top in range(0, height, rows):
+        # Each strip carries a halo of radius rows, so strip seams match a whole-image pass
+        start, stop = max(0, top - radius), min(height, top + rows + radius)
+        block = labels[start:stop]
+        best = block.copy()
+        best_count = np.zeros(block.shape, dtype=np.uint16)
+        own_count = np.zeros(block.shape, dtype=np.uint16)
+        for label in present:
+            mask = block == label
+            counts = cv2.boxFilter(mask.view(np.uint8), cv2.CV_16U, (size, size), normalize=False,
+                                   borderType=cv2.BORDER_REPLICATE)
+            np.copyto(best, label, where=counts > best_count)
+            np.maximum(best_count, counts, out=best_count)
+            np.copyto(own_count, counts, where=mask)
+        filtered = np.where(own_count >= best_count, block, best)
+        result[top:top + rows] = filtered[top - start:top - start + rows]
+    return result
+
+def remove_thin_features(labels: np.ndarray, color_count: int, width: int) -> np.ndarray:
+    """Parts of a region narrower than width pixels (lines, spurs, islands) take the nearest surviving label
+    
+    The nearest surviving pixel can be arbitrarily far away, so the distance transform covers the whole map:
+    about 15 bytes per pixel at peak (float32 distances and int32 nearest-pixel indices among them).
+    """
+    if width <= 1:
+        return labels
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (width, width))
+    removed = np.zeros(labels.shape, dtype=bool)
+    for label in present_labels(labels, color_count):
+        mask = (labels == label).view(np.uint8)
+        opened = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        removed |= mask > opened
+    
+    if not removed.any() or removed.all():
+        return labels
+    # One linear pass finds the nearest kept pixel of every removed one; kept pixels are numbered in scan order
+    _, nearest = cv2.distanceTransformWithLabels(removed.view(np.uint8), cv2.DIST_L2, 3,
+                                                 labelType=cv2.DIST_LABEL_PIXEL)
+    kept = labels[~removed]
+    result = labels.copy()
+    rows = max(1, STRIP_PIXELS // max(1, labels.shape[1]))
+    for top in range(0, len(labels), rows):
+        strip_removed = removed[top:top + rows]
+        result[top:top + rows][strip_removed] = kept[nearest[top:top + rows][strip_removed] - 1]
+    return result
+
+def connected_regions(labels: np.ndarray, color_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """4-connected region id per pixel, plus the area and label of every region
+    
+    Regions span strips, so the int32 region map and one int32 component buffer cover the whole map.
+    """
+    regions = np.zeros(labels.shape, dtype=np.int32)
+    # One component buffer reused for every label
+    components = np.empty(labels.shape, dtype=np.int32)
+    region_labels = []
+    offset = 0
+    for label in present_labels(labels, color_count):
+        mask = labels == label
+        # Plain labeling is several times faster than with stats; areas come from one bincount below
+        count, _ = cv2.connectedComponents(mask.view(np.uint8), labels=components, connectivity=4,
+                                           ltype=cv2.CV_32S)
+        np.add(components, offset - 1, out=regions, where=mask)
+        region_labels.append(np.full(count - 1, label, dtype=labels.dtype))
+        offset += count - 1
+    return regions, strip_bincount(regions, offset), np.concatenate(region_labels)
+
+def _neighbour_votes(labels: np.ndarray, regions: np.ndarray, small_index: np.ndarray, small_count: int,
+                     color_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Shared boundary length between every small region and each label, from large and from all neighbours"""
+    from_large = np.zeros(small_count * color_count, dtype=np.int32)
+    from_all = np.zeros(small_count * color_count, dtype=np.int32)
+    
+    def vote(region_a, region_b, label_a, label_b):
+        small_a, small_b = small_index[region_a], small_index[region_b]
+        boundary = label_a != label_b
+        for small, other_small, other_label in ((small_a, small_b, label_b), (small_b, small_a, label_a)):
+            selected = boundary & (small >= 0)
+            votes = small[selected].astype(np.int64) * color_count + other_label[selected]
+            # Unbuffered adds into the (regions x labels) tables, no per-strip table allocation
+            np.add.at(from_all, votes, 1)
+            np.add.at(from_large, votes[other_small[selected] < 0], 1)
+    
+    height, width = labels.shape
+    rows = max(1, STRIP_PIXELS // max(1, width))
+    for top in range(0, height, rows):
+        # Horizontal pairs within the strip; vertical pairs reach one row into the next strip
+        strip_regions, strip_labels = regions[top:top + rows + 1], labels[top:top + rows + 1]
+        body = min(rows, height - top)
+        vote(strip_regions[:body, :-1], strip_regions[:body, 1:], strip_labels[:body, :-1], strip_labels[:body, 1:])
+        vote(strip_regions[:-1], strip_regions[1:], strip_labels[:-1], strip_labels[1:])
+    return from_large.reshape(small_count, color_count), from_all.reshape(small_count, color_count)
+
+def merge_small_regions(labels: np.ndarray, color_count: int, min_region: int, max_passes: int = 6) -> np.ndarray:
+    """Regions under min_region pixels join the neighbouring label they share the longest boundary with
+    
+    Large neighbours win over other small ones; a pass relabels every small region at once. A region
+    that takes a large neighbour's label becomes part of it, so another pass is only needed when some
+    region was surrounded by small ones (clusters of specks settle over a few passes). Memory is that of
+    connected_regions, about 16 bytes per pixel at peak; only the neighbour votes are gathered in strips.
+    """
+    if min_region <= 1:
+        return labels
+    for _ in range(max_passes):
+        regions, areas, region_labels = connected_regions(labels, color_count)
+        small = areas < min_region
+        small_count = int(small.sum())
+        if small_count == 0:
+            break
+        small_index = np.full(len(areas), -1, dtype=np.int32)
+        small_index[small] = np.arange(small_count, dtype=np.int32)
+        
+        from_large, from_all = _neighbour_votes(labels, regions, small_index, small_count, color_count)
+        large_neighbour = from_large.max(axis=1) > 0
+        votes = np.where(large_neighbour[:, None], from_large, from_all)
+        has_neighbour = votes.max(axis=1) > 0
+        targets = region_labels.copy()
+        targets[small] = np.where(has_neighbour, np.argmax(votes, axis=1), region_labels[small])
+        if np.array_equal(targets, region_labels):
+            break
+        labels = strip_take(targets, regions)
+        # Free this pass's region map before the next pass builds its own
+        del regions
+        if large_neighbour[has_neighbour].all():
+            break
+    return labels
+
+def clean_labels(labels: np.ndarray, color_count: int, cleanup: LabelCleanup) -> np.ndarray:
+    """Apply the enabled steps: majority filter, thin-feature removal, then small-region merging"""
+    if cleanup.mode_size > 1:
+        labels = mode_filter(labels, color_count, cleanup.mode_size)
+    if cleanup.min_feature > 1:
+        labels = remove_thin_features(labels, color_count, cleanup.min_feature)
+    if cleanup.min_region > 1:
+        labels = merge_small_regions(labels, color_count, cleanup.min_region)
+    return labels
\ No newline at end of file
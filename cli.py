@@ -0,0 +1,525 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from domain import ColorPalette, RGBColor, DomainException
+from infrastructure import ImageRepository, ColorAnalyzer, PaletteRepository, PaletteCache, ProjectRepository
+from application import ColorReductionService, ClipReductionService
+from exporters import LayerExporter, ContourExporter
+from frames import FrameReader, RunningHistogram, CLIP_EXTENSIONS, VIDEO_EXTENSIONS, open_frame_writer
+from quantizers import QUANTIZERS, KMEANS_PRESETS, DEFAULT_PRESET
+from colorspaces import METRICS
+from dithering import DITHER_MODES
+from cleanup import LabelCleanup, MM_PER_INCH
+from instrumentation import Instrumentation, JsonLinesSink
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.npy'}
+MANIFEST_NAME = "manifest.jsonl"
+SHARED_PALETTE_NAME = "shared_palette.json"
+
+# Per-process services, created once by the pool initializer
+_worker_services: Dict[str, object] = {}
+
+def collect_inputs(patterns: Iterable[str], recursive: bool = False) -> List[Tuple[Path, Path]]:
+    """Expand files, directories and glob patterns into (input, output-relative) pairs"""
+    inputs = []
+    seen = set()
+    
+    def add(path: Path, relative: Path):
+        resolved = path.resolve()
+        if resolved not in seen and path.suffix.lower() in IMAGE_EXTENSIONS | CLIP_EXTENSIONS:
+            seen.add(resolved)
+            inputs.append((path, relative))
+    
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = path.rglob('*') if recursive else path.glob('*')
+            for candidate in sorted(candidates):
+                if candidate.is_file():
+                    add(candidate, candidate.relative_to(path))
+        elif path.is_file():
+            add(path, Path(path.name))
+        else:
+            # Matches keep their path below the pattern's fixed leading directories, as directory inputs do
+            root = Path(*[part for part in itertools.takewhile(lambda part: not glob.has_magic(part), path.parts)])
+            for match in sorted(glob.glob(pattern, recursive=recursive)):
+                match_path = Path(match)
+                if match_path.is_file():
+                    add(match_path, match_path.relative_to(root))
+    
+    return inputs
+
+def find_output_collisions(inputs: List[Tuple[Path, Path]], output_dir: Path) -> Dict[Path, List[Path]]:
+    """Output bases claimed by more than one input, which would overwrite each other's results"""
+    claims: Dict[Path, List[Path]] = {}
+    for input_path, relative in inputs:
+        claims.setdefault(output_dir / relative.with_name(relative.stem), []).append(input_path)
+    return {base: paths for base, paths in claims.items() if len(paths) > 1}
+
+def _init_worker(settings: dict) -> None:
+    """Build the services once per worker process"""
+    # Share the cores between processes instead of every process spawning a full thread pool
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=settings['threads_per_worker'])
+    
+    cache_dir = settings.get('cache_dir')
+    scratch_dir = settings.get('scratch_dir')
+    trace = settings.get('trace')
+    instrumentation = (Instrumentation(JsonLinesSink(Path(trace)), track_memory=settings.get('trace_memory', False))
+                       if trace else None)
+    analyzer = ColorAnalyzer(quantizer=settings['quantizer'], instrumentation=instrumentation,
+                             preset=settings.get('preset', DEFAULT_PRESET))
+    _worker_services['repository'] = ImageRepository(scratch_dir=Path(scratch_dir) if scratch_dir else None)
+    _worker_services['full_resolution'] = settings['full_resolution']
+    _worker_services['metric'] = settings.get('metric', 'rgb')
+    _worker_services['dither'] = settings.get('dither', 'none')
+    _worker_services['cleanup'] = LabelCleanup(**settings['cleanup']) if settings.get('cleanup') else None
+    _worker_services['layers'] = settings.get('layers')
+    _worker_services['indexed'] = not settings.get('rgb', False)
+    _worker_services['project'] = settings.get('project', False)
+    _worker_services['exporter'] = LayerExporter(max_workers=settings['threads_per_worker'])
+    _worker_services['outlines'] = settings.get('outlines')
+    _worker_services['contour_exporter'] = ContourExporter(
+        tolerance=settings['outline_tolerance'], min_area=settings['min_area'],
+        pixel_size=settings.get('pixel_size'), max_workers=settings['threads_per_worker'],
+    )
+    _worker_services['service'] = ColorReductionService(
+        analyzer,
+        full_resolution=settings['full_resolution'],
+        palette_cache=PaletteCache(cache_dir=Path(cache_dir) if cache_dir else None),
+    )
+    _worker_services['clip_service'] = ClipReductionService(
+        _worker_services['service'], max_workers=settings['threads_per_worker'])
+    _worker_services['refit_interval'] = settings.get('refit_interval')
+    palette = settings.get('palette')
+    _worker_services['palette'] = PaletteRepository().load(Path(palette)) if palette else None
+    shared_palette = settings.get('shared_palette')
+    _worker_services['shared_palette'] = (ColorPalette(tuple(RGBColor.from_hex(color) for color in shared_palette))
+                                          if shared_palette else None)
+
+def output_path_for(base: Path, color_count: Optional[int], extension: str = ".png") -> Path:
+    """Output file next to base; filament mode when there is no color count"""
+    suffix = "_filament" if color_count is None else f"_{color_count}colors"
+    return base.with_name(f"{base.name}{suffix}{extension}")
+
+def reduce_variant(service: ColorReductionService, image, color_count: Optional[int],
+                   palette: Optional[ColorPalette], sweep: bool, sink=None):
+    """Run the reduction for one output variant"""
+    if palette is not None:
+        return service.manual_reduce_colors(image, palette, sink=sink, metric=_worker_services['metric'],
+                                            dither=_worker_services['dither'], cleanup=_worker_services['cleanup'],
+                                            shared_palette=_worker_services['shared_palette'])
+    return service.auto_reduce_colors(image, color_count, sweep=sweep, sink=sink, dither=_worker_services['dither'],
+                                      cleanup=_worker_services['cleanup'],
+                                      shared_palette=_worker_services['shared_palette'])
+
+def variant_label_map(service: ColorReductionService, image, color_count: Optional[int],
+                      palette: Optional[ColorPalette], sweep: bool):
+    """Label map of one output variant, for indexed output and layer export"""
+    if palette is not None:
+        return service.manual_label_map(image, palette, metric=_worker_services['metric'],
+                                        dither=_worker_services['dither'], cleanup=_worker_services['cleanup'],
+                                        shared_palette=_worker_services['shared_palette'])
+    return service.auto_label_map(image, color_count, sweep=sweep, dither=_worker_services['dither'],
+                                  cleanup=_worker_services['cleanup'],
+                                  shared_palette=_worker_services['shared_palette'])
+
+def export_layers(service: ColorReductionService, image, color_count: Optional[int],
+                  palette: Optional[ColorPalette], sweep: bool, output_path: Path) -> List[Path]:
+    """Write the layer masks and outlines that belong to one output variant"""
+    label_map = variant_label_map(service, image, color_count, palette, sweep)
+    paths = []
+    layers = _worker_services['layers']
+    exporter: LayerExporter = _worker_services['exporter']
+    if layers == 'npz':
+        paths.append(exporter.export_bundle(label_map, output_path.with_name(f"{output_path.stem}_layers.npz")))
+    elif layers == 'png':
+        paths.extend(exporter.export_masks(label_map, output_path.parent, f"{output_path.stem}_layer"))
+    
+    outlines = _worker_services['outlines']
+    if outlines:
+        contour_exporter: ContourExporter = _worker_services['contour_exporter']
+        paths.append(contour_exporter.export(label_map, output_path.with_suffix(f".{outlines}")))
+    return paths
+
+def process_clip(input_path: Path, output_base: Path, color_count: Optional[int],
+                 palette: Optional[ColorPalette]) -> Tuple[Path, float]:
+    """Reduce an animation or video frame by frame; returns the output and the megapixels processed"""
+    reader = FrameReader(input_path)
+    extension = ".mp4" if input_path.suffix.lower() in VIDEO_EXTENSIONS else ".gif"
+    output_path = output_path_for(output_base, color_count, extension)
+    clip_service: ClipReductionService = _worker_services['clip_service']
+    with open_frame_writer(output_path, reader.width, reader.height, reader.duration_ms) as sink:
+        clip_service.reduce_clip(reader, sink, color_count=color_count, filament_colors=palette,
+                                 metric=_worker_services['metric'],
+                                 refit_interval=_worker_services['refit_interval'],
+                                 dither=_worker_services['dither'],
+                                 shared_palette=_worker_services['shared_palette'])
+        frames = sink.frames_written
+    return output_path, frames * reader.width * reader.height / 1e6
+
+def process_image(input_path: Path, output_base: Path, color_count: Optional[int], sweep: bool,
+                  palette: Optional[ColorPalette]) -> Tuple[List[Path], float]:
+    """Reduce a still image into every requested variant; returns the outputs and the megapixels processed"""
+    repository: ImageRepository = _worker_services['repository']
+    service: ColorReductionService = _worker_services['service']
+    
+    image = repository.load(input_path)
+    if palette is not None:
+        counts = [None]
+    elif sweep:
+        # One sweep fit serves every variant from 1 to color_count
+        service.sweep_palettes(image, color_count)
+        counts = list(range(1, color_count + 1))
+    else:
+        counts = [color_count]
+    
+    outputs = []
+    height, width = image.dimensions
+    for count in counts:
+        output_path = output_path_for(output_base, count)
+        indexed = _worker_services['indexed']
+        if _worker_services['full_resolution']:
+            # Source-resolution output is streamed to disk tile by tile instead of built in memory
+            with repository.open_sink(output_path, width, height, indexed=indexed) as sink:
+                reduce_variant(service, image, count, palette, sweep, sink=sink)
+        elif indexed:
+            repository.save_indexed(variant_label_map(service, image, count, palette, sweep), output_path)
+        else:
+            repository.save(reduce_variant(service, image, count, palette, sweep), output_path)
+        outputs.append(output_path)
+        if _worker_services['layers'] or _worker_services['outlines']:
+            outputs.extend(export_layers(service, image, count, palette, sweep, output_path))
+        if _worker_services['project']:
+            project = service.create_project(image, count, palette, sweep=sweep, metric=_worker_services['metric'],
+                                             dither=_worker_services['dither'], cleanup=_worker_services['cleanup'],
+                                             shared_palette=_worker_services['shared_palette'])
+            project_path = output_path.with_name(f"{output_path.stem}_project.npz")
+            ProjectRepository().save(project, project_path)
+            outputs.append(project_path)
+    
+    return outputs, image.total_pixels / 1e6
+
+def process_file(input_path: str, output_base: str, color_count: Optional[int], sweep: bool = False) -> dict:
+    """Reduce a single image or clip; errors are returned as a record instead of raised"""
+    started = time.perf_counter()
+    record = {'input': input_path, 'outputs': []}
+    try:
+        palette: Optional[ColorPalette] = _worker_services['palette']
+        if Path(input_path).suffix.lower() in CLIP_EXTENSIONS:
+            # Sweeps and layer exports are per still image; a clip gets one reduced animation
+            output_path, megapixels = process_clip(Path(input_path), Path(output_base), color_count, palette)
+            outputs = [output_path]
+        else:
+            outputs, megapixels = process_image(Path(input_path), Path(output_base), color_count, sweep, palette)
+        record['outputs'] = [str(path) for path in outputs]
+        record.update(status='ok', megapixels=megapixels)
+    except Exception as e:
+        record.update(status='error', error=str(e))
+    
+    record['seconds'] = round(time.perf_counter() - started, 3)
+    _worker_services['service'].instrumentation.event(
+        "file", input=input_path, status=record['status'], seconds=record['seconds'])
+    return record
+
+def collect_histogram(input_path: str) -> Tuple[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]], Optional[str]]:
+    """Occupied bins of one input's normalized color histogram, or the error it could not be read with"""
+    path = Path(input_path)
+    service: ColorReductionService = _worker_services['service']
+    try:
+        if path.suffix.lower() in CLIP_EXTENSIONS:
+            # A clip counts as one input, however many frames it has
+            histogram = _worker_services['clip_service'].color_histogram(FrameReader(path))
+        else:
+            repository: ImageRepository = _worker_services['repository']
+            image = repository.load_reduced(path, service.color_analyzer.analysis_max_dimension)
+            histogram = service.color_histogram(image)
+    except Exception as e:
+        return None, str(e)
+    histogram.normalize()
+    return histogram.occupied(), None
+
+def fit_shared_palette(inputs: List[Tuple[Path, Path]], color_count: int, settings: dict,
+                       workers: int) -> Tuple[ColorPalette, Dict[str, str]]:
+    """One palette for the whole batch, fitted on the merged histograms of every input; also returns the
+    error of every input that could not be read
+    
+    Inputs are decoded once each, in parallel and at reduced scale. At most two histograms per worker are
+    in flight, so memory does not grow with the batch size.
+    """
+    service = ColorReductionService(ColorAnalyzer(quantizer=settings['quantizer'], preset=settings['preset']))
+    histogram = RunningHistogram(service.color_analyzer.histogram_bits)
+    failures: Dict[str, str] = {}
+    names = {}
+    
+    def merge(done):
+        for future in done:
+            input_path = names.pop(future)
+            try:
+                occupied, error = future.result()
+            except Exception as e:
+                occupied, error = None, f"Worker failed: {str(e)}"
+            if occupied is not None:
+                histogram.merge(*occupied)
+            else:
+                failures[input_path] = error
+                print(f"Shared palette: cannot read {input_path}: {error}", file=sys.stderr)
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings,)) as pool:
+        pending = set()
+        for input_path, _ in inputs:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                merge(done)
+            future = pool.submit(collect_histogram, str(input_path))
+            names[future] = str(input_path)
+            pending.add(future)
+        merge(wait(pending)[0])
+    return service.fit_shared_palette(histogram, color_count), failures
+
+def load_manifest(manifest_path: Path) -> Dict[str, dict]:
+    """Latest manifest record per input, tolerating a truncated last line"""
+    records = {}
+    if not manifest_path.exists():
+        return records
+    with open(manifest_path, encoding='utf-8') as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['input']] = record
+    return records
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="color-reduction",
+        description="Headless batch color reduction for 3D printing",
+    )
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True, type=Path, help="Output directory")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('-c', '--colors', type=int, choices=range(1, 13), metavar='N',
+                        help="Reduce to N automatically chosen colors (1-12)")
+    target.add_argument('-p', '--palette', type=Path,
+                        help="Filament palette file (.json list or one hex color per line)")
+    parser.add_argument('-m', '--metric', default='rgb', choices=list(METRICS),
+                        help="Color distance used to match pixels with --palette (default: rgb)")
+    parser.add_argument('-q', '--quantizer', default='kmeans', choices=list(QUANTIZERS),
+                        help="Quantizer backend (default: kmeans)")
+    parser.add_argument('--preset', default=DEFAULT_PRESET, choices=list(KMEANS_PRESETS),
+                        help=f"K-means speed/quality preset; fits are seeded, so outputs are reproducible "
+                             f"(default: {DEFAULT_PRESET})")
+    parser.add_argument('--dither', default='none', choices=DITHER_MODES,
+                        help="Dithering of the reduced output: ordered (bayer, blue-noise) or error diffusion "
+                             "(floyd-steinberg, atkinson) (default: none)")
+    parser.add_argument('--sweep', action='store_true',
+                        help="With --colors N, write every variant from 1 to N colors from a single fit")
+    parser.add_argument('--shared-palette', action='store_true',
+                        help="Fit one palette across all inputs and apply it to every image, so the whole batch "
+                             "prints with the same filaments")
+    parser.add_argument('--layers', choices=['png', 'npz'],
+                        help="Also export one mask per color: 1-bit PNGs or a packed .npz bundle")
+    parser.add_argument('--outlines', choices=['svg', 'dxf'],
+                        help="Also export per-color polygon outlines for slicers")
+    parser.add_argument('--outline-tolerance', type=float, default=1.0,
+                        help="Outline simplification tolerance in pixels (default: 1.0)")
+    parser.add_argument('--min-area', type=float, default=16.0,
+                        help="Drop outline regions smaller than this many pixels (default: 16)")
+    parser.add_argument('--pixel-size', type=float, help="Outline and feature scale in mm per output pixel")
+    parser.add_argument('--dpi', type=float, help="Print resolution, an alternative to --pixel-size")
+    parser.add_argument('--mode-filter', type=int, default=0, metavar='SIZE',
+                        help="Printability cleanup: majority filter over SIZE x SIZE windows (odd, e.g. 3)")
+    parser.add_argument('--min-feature', type=float, default=0.0, metavar='MM',
+                        help="Printability cleanup: remove parts narrower than MM millimetres "
+                             "(needs --pixel-size or --dpi)")
+    parser.add_argument('--min-region', type=int, default=0, metavar='PX',
+                        help="Printability cleanup: merge regions under PX pixels into their dominant neighbour")
+    parser.add_argument('--full-resolution', action='store_true', help="Write output at the source resolution")
+    parser.add_argument('--rgb', action='store_true',
+                        help="Write 24-bit RGB PNGs instead of 8-bit palettized ones")
+    parser.add_argument('--project', action='store_true',
+                        help="Also save a project file (.npz) per output that the GUI reopens without the source")
+    parser.add_argument('--refit-interval', type=int, metavar='FRAMES',
+                        help="Animations and videos: refit the palette every FRAMES frames in a single pass "
+                             "instead of fitting one palette for the whole clip")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Recurse into directories and ** globs")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--cache-dir', type=Path, help="Persist fitted palettes across runs")
+    parser.add_argument('--scratch-dir', type=Path,
+                        help="Where very large decoded images are memory-mapped (default: system temp)")
+    parser.add_argument('--trace', type=Path, help="Append per-stage timing records to this JSON lines file")
+    parser.add_argument('--trace-memory', action='store_true', help="Include peak allocations in --trace records")
+    parser.add_argument('--no-resume', action='store_true', help="Reprocess files already in the manifest")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Batch entry point; returns a process exit code"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.sweep and args.colors is None:
+        parser.error("--sweep requires --colors")
+    if args.refit_interval is not None and args.refit_interval < 1:
+        parser.error("--refit-interval must be at least 1")
+    if args.shared_palette and (args.sweep or args.refit_interval is not None):
+        parser.error("--shared-palette cannot be combined with --sweep or --refit-interval")
+    if args.pixel_size is None and args.dpi:
+        args.pixel_size = MM_PER_INCH / args.dpi
+    if args.mode_filter > 1 and args.mode_filter % 2 == 0:
+        parser.error("--mode-filter must be odd")
+    if args.min_feature > 0 and args.pixel_size is None:
+        parser.error("--min-feature requires --pixel-size or --dpi")
+    cleanup = LabelCleanup.for_print(args.min_feature, args.pixel_size, mode_size=args.mode_filter,
+                                     min_region=args.min_region)
+    
+    if args.palette is not None:
+        # Fail fast on a bad palette file before starting any workers
+        try:
+            filament_palette = PaletteRepository().load(args.palette)
+        except DomainException as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        settings_key = f"palette:{','.join(color.hex for color in filament_palette.colors)}|{args.metric}"
+    else:
+        settings_key = f"colors:{args.colors}|sweep={args.sweep}"
+    settings_key += f"|{args.quantizer}:{args.preset}|full={args.full_resolution}|layers={args.layers}"
+    if args.refit_interval:
+        settings_key += f"|refit={args.refit_interval}"
+    if args.dither != 'none':
+        settings_key += f"|dither={args.dither}"
+    if args.rgb:
+        settings_key += "|rgb"
+    if cleanup.enabled:
+        settings_key += f"|cleanup={cleanup.token}"
+    if args.project:
+        settings_key += "|project"
+    if args.outlines:
+        settings_key += f"|outlines={args.outlines}:{args.outline_tolerance}:{args.min_area}:{args.pixel_size}"
+    
+    inputs = collect_inputs(args.inputs, args.recursive)
+    if not inputs:
+        print("No input images found", file=sys.stderr)
+        return 2
+    
+    collisions = find_output_collisions(inputs, args.output)
+    if collisions:
+        for base, paths in collisions.items():
+            print(f"Inputs {', '.join(map(str, paths))} would all write to {base}_*", file=sys.stderr)
+        return 2
+    
+    args.output.mkdir(parents=True, exist_ok=True)
+    
+    settings = {
+        'threads_per_worker': max(1, (os.cpu_count() or 1) // max(1, args.workers)),
+        'quantizer': args.quantizer,
+        'preset': args.preset,
+        'full_resolution': args.full_resolution,
+        'cache_dir': str(args.cache_dir) if args.cache_dir else None,
+        'scratch_dir': str(args.scratch_dir) if args.scratch_dir else None,
+        'palette': str(args.palette) if args.palette else None,
+        'layers': args.layers,
+        'metric': args.metric,
+        'trace': str(args.trace) if args.trace else None,
+        'trace_memory': args.trace_memory,
+        'outlines': args.outlines,
+        'outline_tolerance': args.outline_tolerance,
+        'min_area': args.min_area,
+        'pixel_size': args.pixel_size,
+        'refit_interval': args.refit_interval,
+        'dither': args.dither,
+        'rgb': args.rgb,
+        'cleanup': asdict(cleanup) if cleanup.enabled else None,
+        'project': args.project,
+    }
+    
+    palette_failures: Dict[str, str] = {}
+    if args.shared_palette:
+        started = time.perf_counter()
+        color_count = args.colors or len(filament_palette)
+        try:
+            shared_palette, palette_failures = fit_shared_palette(inputs, color_count, settings,
+                                                                  max(1, args.workers))
+        except DomainException as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        PaletteRepository().save(shared_palette, args.output / SHARED_PALETTE_NAME)
+        settings['shared_palette'] = [color.hex for color in shared_palette.colors]
+        settings_key += f"|shared={','.join(settings['shared_palette'])}"
+        print(f"Shared palette from {len(inputs) - len(palette_failures)} inputs in {time.perf_counter() - started:.1f}s: "
+              f"{' '.join(settings['shared_palette'])}")
+    
+    manifest_path = args.output / MANIFEST_NAME
+    previous = {} if args.no_resume else load_manifest(manifest_path)
+    
+    tasks = []
+    skipped = 0
+    for input_path, relative in inputs:
+        if str(input_path) in palette_failures:
+            # Left out of the palette, so also left out of the batch rather than reduced with it
+            continue
+        output_base = args.output / relative.with_name(relative.stem)
+        done = previous.get(str(input_path))
+        if (done and done.get('status') == 'ok' and done.get('settings') == settings_key
+                and all(Path(output).exists() for output in done.get('outputs', []))):
+            skipped += 1
+            continue
+        tasks.append((str(input_path), str(output_base)))
+    
+    print(f"{len(inputs)} images, {skipped} already done, {len(tasks)} to process "
+          f"with {args.workers} workers")
+    
+    started = time.perf_counter()
+    succeeded = failed = 0
+    megapixels = 0.0
+    
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker,
+                                initargs=(settings,)) as pool:
+        for input_path, error in palette_failures.items():
+            record = {'input': input_path, 'outputs': [], 'status': 'error',
+                      'error': f"Shared palette: {error}", 'settings': settings_key}
+            manifest.write(json.dumps(record) + "\n")
+            failed += 1
+        manifest.flush()
+        
+        futures = {pool.submit(process_file, input_path, output_base, args.colors, args.sweep): input_path
+                   for input_path, output_base in tasks}
+        
+        for index, future in enumerate(as_completed(futures), start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                # A crashed worker breaks the pool, failing every unfinished file; a resumed run retries them
+                record = {'input': futures[future], 'outputs': [],
+                          'status': 'error', 'error': f"Worker failed: {str(e)}"}
+            record['settings'] = settings_key
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            
+            if record['status'] == 'ok':
+                succeeded += 1
+                megapixels += record['megapixels']
+                print(f"[{index}/{len(tasks)}] {record['input']} -> {', '.join(record['outputs'])} "
+                      f"({record['seconds']:.2f}s)")
+            else:
+                failed += 1
+                print(f"[{index}/{len(tasks)}] FAILED {record['input']}: {record['error']}", file=sys.stderr)
+    
+    elapsed = time.perf_counter() - started
+    print(f"Done: {succeeded} ok, {failed} failed, {skipped} skipped in {elapsed:.1f}s "
+          f"({succeeded / elapsed if elapsed else 0:.2f} images/s, "
+          f"{megapixels / elapsed if elapsed else 0:.2f} MP/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
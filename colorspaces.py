@@ -0,0 +1,69 @@
+from typing import Callable, Dict
+import numpy as np
+from domain import ColorProcessingException
+
+def _srgb_to_linear_table() -> np.ndarray:
+    """sRGB transfer function inverted once for all 256 channel values"""
+    values = np.arange(256, dtype=np.float64) / 255.0
+    linear = np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+    return linear.astype(np.float32)
+
+SRGB_TO_LINEAR = _srgb_to_linear_table()
+
+# Linear sRGB -> LMS and cube-rooted LMS -> OKLab (Björn Ottosson)
+_OKLAB_LMS = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+], dtype=np.float32)
+_OKLAB_LAB = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+], dtype=np.float32)
+
+# Linear sRGB -> XYZ, pre-divided by the D65 white point
+_XYZ_D65 = (np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+]) / np.array([[0.95047], [1.0], [1.08883]])).astype(np.float32)
+
+def _linear(pixels: np.ndarray) -> np.ndarray:
+    """Linear-light float32 RGB through the cached per-channel table"""
+    return SRGB_TO_LINEAR[pixels]
+
+def to_rgb(pixels: np.ndarray) -> np.ndarray:
+    """Plain RGB coordinates, as integers so squared distances stay exact"""
+    return pixels.astype(np.int32)
+
+def to_oklab(pixels: np.ndarray) -> np.ndarray:
+    """OKLab coordinates (float32) of uint8 sRGB pixels"""
+    lms = np.cbrt(_linear(pixels) @ _OKLAB_LMS.T)
+    return lms @ _OKLAB_LAB.T
+
+def to_lab(pixels: np.ndarray) -> np.ndarray:
+    """CIELAB (D65) coordinates (float32) of uint8 sRGB pixels"""
+    xyz = _linear(pixels) @ _XYZ_D65.T
+    epsilon, kappa = 216 / 24389, 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1).astype(np.float32)
+
+METRICS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "rgb": to_rgb,
+    "oklab": to_oklab,
+    "lab": to_lab,
+}
+
+def color_space(metric: str) -> Callable[[np.ndarray], np.ndarray]:
+    """Converter into the space whose Euclidean distance defines the metric"""
+    try:
+        return METRICS[metric]
+    except KeyError:
+        raise ColorProcessingException(
+            f"Unknown color metric '{metric}'. Available: {', '.join(METRICS)}"
+        ) from None
\ No newline at end of file
@@ -0,0 +1,186 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple, Type
+import numpy as np
+from domain import ColorProcessingException
+from colorspaces import color_space
+
+# Labels of a band of rows and the row it starts at
+LabelTile = Tuple[int, np.ndarray]
+
+def _bayer_matrix(size: int) -> np.ndarray:
+    """Recursive Bayer threshold matrix with values in [0, 1)"""
+    matrix = np.zeros((1, 1))
+    while len(matrix) < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return (matrix / matrix.size).astype(np.float32)
+
+@lru_cache(maxsize=None)
+def _blue_noise_matrix(size: int = 64, seed: int = 0) -> np.ndarray:
+    """Tileable blue-noise thresholds: high-pass filtered white noise, ranked to a uniform [0, 1) spread"""
+    noise = np.random.default_rng(seed).random((size, size))
+    frequencies = np.fft.fftfreq(size)
+    radius = np.hypot(frequencies[:, None], frequencies[None, :])
+    # Periodic filtering keeps the texture seamless when tiled
+    high_pass = 1.0 - np.exp(-(radius / 0.18) ** 2)
+    for _ in range(3):
+        noise = np.real(np.fft.ifft2(np.fft.fft2(noise) * high_pass))
+    ranks = np.argsort(np.argsort(noise, axis=None), kind='stable').reshape(size, size)
+    return (ranks / ranks.size).astype(np.float32)
+
+def palette_spread(palette_array: np.ndarray) -> float:
+    """Mean distance from each palette color to its nearest neighbour, the scale of a useful dither"""
+    if len(palette_array) < 2:
+        return 0.0
+    palette = palette_array.astype(np.float32)
+    distances = np.sqrt(np.sum((palette[:, None, :] - palette[None, :, :]) ** 2, axis=2))
+    np.fill_diagonal(distances, np.inf)
+    return float(np.mean(distances.min(axis=1)))
+
+class Ditherer(ABC):
+    """Base class for dithering modes: yields label tiles like PaletteAssigner.iter_label_tiles"""
+    
+    name = "base"
+    
+    @abstractmethod
+    def iter_label_tiles(self, pixels: np.ndarray, palette_array: np.ndarray, assigner,
+                         metric: str = "rgb") -> Iterator[LabelTile]:
+        """Label tiles of pixels dithered onto palette_array"""
+
+class OrderedDitherer(Ditherer):
+    """Ordered dithering: a tiled threshold offset before the lookup, vectorized over whole tiles"""
+    
+    def __init__(self, strength: float = 1.0):
+        self.strength = strength
+    
+    @abstractmethod
+    def thresholds(self) -> np.ndarray:
+        """Tileable threshold matrix with values in [0, 1)"""
+    
+    def iter_label_tiles(self, pixels: np.ndarray, palette_array: np.ndarray, assigner,
+                         metric: str = "rgb") -> Iterator[LabelTile]:
+        height, width = pixels.shape[:2]
+        matrix = self.thresholds()
+        size = len(matrix)
+        spread = palette_spread(palette_array) * self.strength
+        # One period of rows, tiled across the width; tiles pick rows by their offset into the period
+        offsets = (np.tile(matrix, (1, width // size + 1))[:, :width] - 0.5) * spread
+        rows = assigner.tile_rows(width, len(palette_array))
+        
+        for top in range(0, height, rows):
+            tile = pixels[top:top + rows]
+            phase = (np.arange(top, top + len(tile)) % size)
+            shifted = tile.astype(np.float32) + offsets[phase][:, :, None]
+            np.clip(shifted, 0, 255, out=shifted)
+            yield top, assigner.lookup_labels(shifted.astype(np.uint8), palette_array, metric)
+
+class BayerDitherer(OrderedDitherer):
+    """8x8 Bayer matrix: regular cross-hatch pattern, cheapest"""
+    
+    name = "bayer"
+    
+    def thresholds(self) -> np.ndarray:
+        return _bayer_matrix(8)
+
+class BlueNoiseDitherer(OrderedDitherer):
+    """64x64 blue-noise texture: no visible grid, same cost as Bayer"""
+    
+    name = "blue-noise"
+    
+    def thresholds(self) -> np.ndarray:
+        return _blue_noise_matrix()
+
+class ErrorDiffusionDitherer(Ditherer):
+    """Error diffusion along anti-diagonal wavefronts, in row strips that carry their error downwards
+    
+    A pixel only depends on pixels with a smaller x + 2y, so every such diagonal is one vectorized
+    step. Strips are stored skewed (indexed by x + 2y, then y), which makes each diagonal and each
+    kernel tap a contiguous slice; strips run top to bottom with the spilled error carried over, so
+    there is no seam.
+    """
+    
+    # (dy, dx, weight) of the pixels receiving the quantization error
+    KERNEL: List[Tuple[int, int, float]] = []
+    STRIP_BYTES = 64 * 1024 * 1024
+    PAD = 2  # Columns of padding on each side and spill rows below the strip
+    
+    def strip_rows(self, width: int) -> int:
+        """Rows per strip so the skewed float32 working buffer stays within STRIP_BYTES"""
+        rows = max(1, self.STRIP_BYTES // (12 * (width + 4 * self.PAD)))
+        # The skewed buffer grows by two diagonals per row, so keep strips narrower than they are wide
+        return min(rows, max(1, width // 2))
+    
+    def iter_label_tiles(self, pixels: np.ndarray, palette_array: np.ndarray, assigner,
+                         metric: str = "rgb") -> Iterator[LabelTile]:
+        height, width = pixels.shape[:2]
+        to_space = color_space(metric)
+        palette = palette_array.astype(np.float32)
+        # Nearest color by |p|² - 2 v·p, one small matrix product per diagonal
+        palette_space = to_space(palette_array).astype(np.float32)
+        projection = -2 * palette_space.T
+        norms = np.sum(palette_space ** 2, axis=1)
+        pad = self.PAD
+        taps = [(dx + 2 * dy, dy, weight) for dy, dx, weight in self.KERNEL]
+        carry = np.zeros((pad, width + 2 * pad, 3), dtype=np.float32)
+        
+        rows = self.strip_rows(width)
+        for top in range(0, height, rows):
+            strip = pixels[top:top + rows]
+            strip_height = len(strip)
+            # Padded pixel (y, x) lives at work[x + 2y, y]
+            work = np.zeros((width + 2 * pad + 2 * (strip_height + pad), strip_height + pad, 3), dtype=np.float32)
+            skewed_labels = np.empty((len(work), strip_height), dtype=np.uint8)
+            for y in range(strip_height):
+                work[2 * y + pad:2 * y + pad + width, y] = strip[y]
+            for y in range(pad):
+                work[2 * y:2 * y + width + 2 * pad, y] += carry[y]
+            
+            for wave in range(pad, width + pad + 2 * (strip_height - 1)):
+                first = max(0, -((width + pad - 1 - wave) // 2))
+                last = min(strip_height - 1, (wave - pad) // 2)
+                values = work[wave, first:last + 1]
+                
+                quantized = np.clip(np.rint(values), 0, 255)
+                if metric != "rgb":
+                    quantized = to_space(quantized.astype(np.uint8))
+                nearest = np.argmin(quantized @ projection + norms, axis=1)
+                skewed_labels[wave, first:last + 1] = nearest
+                
+                error = values - palette[nearest]
+                for shift, dy, weight in taps:
+                    work[wave + shift, first + dy:last + 1 + dy] += error * weight
+            
+            labels = np.empty((strip_height, width), dtype=np.uint8)
+            for y in range(strip_height):
+                labels[y] = skewed_labels[2 * y + pad:2 * y + pad + width, y]
+            for y in range(pad):
+                row = strip_height + y
+                carry[y] = work[2 * row:2 * row + width + 2 * pad, row]
+            yield top, labels
+
+class FloydSteinbergDitherer(ErrorDiffusionDitherer):
+    """Floyd–Steinberg: diffuses all of the error to four neighbours"""
+    
+    name = "floyd-steinberg"
+    KERNEL = [(0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)]
+
+class AtkinsonDitherer(ErrorDiffusionDitherer):
+    """Atkinson: diffuses three quarters of the error, keeping flat areas and contrast cleaner"""
+    
+    name = "atkinson"
+    KERNEL = [(0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8)]
+
+DITHERS: Dict[str, Type[Ditherer]] = {
+    ditherer.name: ditherer
+    for ditherer in (BayerDitherer, BlueNoiseDitherer, FloydSteinbergDitherer, AtkinsonDitherer)
+}
+DITHER_MODES = ["none"] + list(DITHERS)
+
+def create_ditherer(name: str) -> Ditherer:
+    """Instantiate a dithering mode by name"""
+    try:
+        return DITHERS[name]()
+    except KeyError:
+        raise ColorProcessingException(
+            f"Unknown dither mode '{name}'. Available: {', '.join(DITHER_MODES)}"
+        ) from None
\ No newline at end of file
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from typing import Tuple, List
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Dict, Tuple, List
 from pathlib import Path
 import numpy as np
 
@@ -22,7 +23,7 @@ class RGBColor:
     def hex(self) -> str:
         return f"#{self.r:02x}{self.g:02x}{self.b:02x}"
     
-    @property
+    @cached_property
     def luminosity(self) -> float:
         """Perceived brightness for human vision"""
         return 0.2126 * (self.r/255.0) + 0.7152 * (self.g/255.0) + 0.0722 * (self.b/255.0)
@@ -30,6 +31,13 @@ class RGBColor:
     @classmethod
     def from_tuple(cls, rgb_tuple: Tuple[int, int, int]) -> 'RGBColor':
         return cls(*rgb_tuple)
+    
+    @classmethod
+    def from_hex(cls, hex_value: str) -> 'RGBColor':
+        value = hex_value.strip().lstrip('#')
+        if len(value) != 6:
+            raise ValueError(f"Invalid hex color: {hex_value}")
+        return cls(int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16))
 
 @dataclass(frozen=True)
 class ColorPalette:
@@ -62,6 +70,37 @@ class Image:
     def total_pixels(self) -> int:
         return self.pixels.shape[0] * self.pixels.shape[1]
 
+@dataclass
+class LabelMap:
+    """Palette index per pixel, with the color each index prints as"""
+    labels: np.ndarray
+    palette: ColorPalette
+    
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return self.labels.shape[:2]
+    
+    def __len__(self) -> int:
+        return len(self.palette)
+
+@dataclass
+class Project:
+    """Saved reduction session: labels over the fitted palette and the color each palette entry prints as"""
+    labels: np.ndarray
+    palette: ColorPalette
+    output_colors: ColorPalette
+    source_fingerprint: str
+    source_path: Path
+    settings: Dict[str, object] = field(default_factory=dict)
+    
+    def __post_init__(self):
+        if len(self.output_colors) != len(self.palette):
+            raise ValueError("Every palette entry needs an output color")
+    
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return self.labels.shape[:2]
+
 class DomainException(Exception):
     """Base domain exception"""
     pass
@@ -72,4 +111,12 @@ class InvalidImageException(DomainException):
 
 class ColorProcessingException(DomainException):
     """Raised when color processing fails"""
+    pass
+
+class JobCancelledException(DomainException):
+    """Raised when a running job is cancelled by the user"""
+    pass
+
+class QueueFullException(DomainException):
+    """Raised when the job queue cannot take more work"""
     pass
\ No newline at end of file
@@ -0,0 +1,253 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+import cv2
+import numpy as np
+from domain import LabelMap, DomainException, InvalidImageException
+from colorspaces import to_oklab
+from infrastructure import PngStripWriter
+
+class LayerExporter:
+    """Writes one mask per palette color (filament layer) from a label map"""
+    
+    STRIP_BYTES = 32 * 1024 * 1024
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+    
+    def strip_rows(self, label_map: LabelMap) -> int:
+        """Rows per strip so the one-hot expansion stays within STRIP_BYTES"""
+        width = label_map.dimensions[1]
+        return max(1, self.STRIP_BYTES // max(1, width * len(label_map)))
+    
+    @staticmethod
+    def packed_masks(labels: np.ndarray, layer_count: int) -> np.ndarray:
+        """Bit-packed masks of shape (layers, rows, ceil(width / 8)) from one pass over the labels"""
+        # One gather builds every layer's mask at once instead of a full comparison per color
+        one_hot = np.eye(layer_count, dtype=bool)[labels]
+        return np.moveaxis(np.packbits(one_hot, axis=1), 2, 0)
+    
+    def mask_paths(self, label_map: LabelMap, output_dir: Path, stem: str) -> List[Path]:
+        """File name per layer: index and color, e.g. photo_01_1a2b3c.png"""
+        return [output_dir / f"{stem}_{index:02d}_{color.hex[1:]}.png"
+                for index, color in enumerate(label_map.palette.colors, start=1)]
+    
+    def export_masks(self, label_map: LabelMap, output_dir: Path, stem: str,
+                     progress: Optional[Callable[[float], None]] = None) -> List[Path]:
+        """Write a 1-bit PNG per layer (white = print this filament), encoded in parallel"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        height, width = label_map.dimensions
+        layer_count = len(label_map)
+        paths = self.mask_paths(label_map, output_dir, stem)
+        writers = []
+        
+        try:
+            # Opened one by one inside the try, so a failed open aborts the writers before it
+            for path in paths:
+                writers.append(PngStripWriter(path, width, height, channels=1, bit_depth=1))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                rows = self.strip_rows(label_map)
+                for top in range(0, height, rows):
+                    packed = self.packed_masks(label_map.labels[top:top + rows], layer_count)
+                    # zlib releases the GIL, so layers compress concurrently
+                    list(pool.map(lambda layer: writers[layer].write_rows(packed[layer]), range(layer_count)))
+                    if progress is not None:
+                        progress(min(top + rows, height) / height)
+                list(pool.map(lambda writer: writer.close(), writers))
+        except Exception as e:
+            for writer in writers:
+                writer.abort()
+            if isinstance(e, DomainException):
+                raise
+            raise InvalidImageException(f"Layer export failed: {str(e)}")
+        
+        return paths
+    
+    def export_bundle(self, label_map: LabelMap, file_path: Path) -> Path:
+        """Write all layers as one compressed .npz of np.packbits masks"""
+        height, width = label_map.dimensions
+        layer_count = len(label_map)
+        masks = np.empty((layer_count, height, (width + 7) // 8), dtype=np.uint8)
+        
+        rows = self.strip_rows(label_map)
+        for top in range(0, height, rows):
+            masks[:, top:top + rows] = self.packed_masks(label_map.labels[top:top + rows], layer_count)
+        
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(
+                file_path, masks=masks, width=width,
+                colors=np.array([color.tuple for color in label_map.palette.colors], dtype=np.uint8),
+            )
+        except OSError as e:
+            raise InvalidImageException(f"Layer export failed: {str(e)}")
+        return file_path
+    
+    @staticmethod
+    def load_bundle(file_path: Path) -> np.ndarray:
+        """Boolean masks of shape (layers, height, width) from an exported bundle"""
+        with np.load(file_path) as bundle:
+            return np.unpackbits(bundle['masks'], axis=2, count=int(bundle['width'])).astype(bool)
+
+@lru_cache(maxsize=None)
+def _aci_colors() -> np.ndarray:
+    """RGB of the AutoCAD Color Index entries 1-255 (row i is index i + 1), the only layer colors R12 knows"""
+    colors = [(255, 0, 0), (255, 255, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255), (255, 0, 255),
+              (255, 255, 255), (128, 128, 128), (192, 192, 192)]
+    # 10-249: 24 hues 15 degrees apart, each at five shades, alternately fully and half saturated
+    for hue in range(0, 360, 15):
+        base = np.clip(np.abs((hue / 60 + np.array([0, 4, 2])) % 6 - 3) - 1, 0, 1)
+        for level in (255, 204, 153, 127, 76):
+            colors.append(tuple(np.rint(level * base)))
+            colors.append(tuple(np.rint(level * (0.5 + 0.5 * base))))
+    colors.extend((grey, grey, grey) for grey in (51, 91, 132, 173, 214, 255))
+    return to_oklab(np.array(colors, dtype=np.uint8))
+
+def nearest_aci(color) -> int:
+    """Perceptually closest AutoCAD Color Index, skipping 7 (drawn black or white depending on the background)"""
+    distances = np.sum((_aci_colors() - to_oklab(np.array([color.tuple], dtype=np.uint8))) ** 2, axis=1)
+    distances[6] = np.inf
+    return int(np.argmin(distances)) + 1
+
+# Outer ring followed by its holes, in pixel-corner coordinates
+Shape = List[np.ndarray]
+
+class ContourExporter:
+    """Traces every color layer of a label map into simplified polygon outlines (SVG or DXF)"""
+    
+    def __init__(self, tolerance: float = 1.0, min_area: float = 16.0,
+                 pixel_size: Optional[float] = None, max_workers: Optional[int] = None):
+        self.tolerance = tolerance
+        self.min_area = min_area
+        self.pixel_size = pixel_size  # mm per pixel; None keeps pixel units
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+    
+    def layer_mask(self, labels: np.ndarray, layer: int) -> np.ndarray:
+        """Mask of one layer without islands under min_area pixels and with its holes under min_area filled"""
+        mask = (labels == layer).view(np.uint8)
+        if self.min_area <= 1:
+            return mask
+        _, components, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        small = stats[:, cv2.CC_STAT_AREA] < self.min_area
+        small[0] = False
+        if small[1:].any():
+            mask[small[components]] = 0
+        
+        # Background components off the image border are holes; small ones are covered by this layer
+        height, width = mask.shape
+        _, components, stats, _ = cv2.connectedComponentsWithStats(1 - mask, connectivity=4)
+        left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        inside = ((left > 0) & (top > 0) & (left + stats[:, cv2.CC_STAT_WIDTH] < width)
+                  & (top + stats[:, cv2.CC_STAT_HEIGHT] < height))
+        fill = inside & (stats[:, cv2.CC_STAT_AREA] < self.min_area)
+        fill[0] = False
+        if fill.any():
+            mask[fill[components]] = 1
+        return mask
+    
+    def trace_layer(self, labels: np.ndarray, layer: int) -> List[Shape]:
+        """Simplified outlines of one layer along pixel edges, holes kept with their outer ring
+        
+        findContours follows pixel centres, which would leave a pixel-wide gap between neighbouring layers.
+        It runs instead on a doubled mask in which every pixel also covers the next sub-pixel to the right and
+        below, so pixel x spans sub-pixels 2x to 2x + 2 and halved coordinates fall on pixel corners.
+        """
+        mask = self.layer_mask(labels, layer)
+        height, width = mask.shape
+        doubled = np.zeros((2 * height + 1, 2 * width + 1), dtype=np.uint8)
+        doubled[:-1, :-1] = cv2.resize(mask, (2 * width, 2 * height), interpolation=cv2.INTER_NEAREST)
+        doubled = cv2.dilate(doubled, np.ones((2, 2), dtype=np.uint8), anchor=(1, 1))
+        contours, hierarchy = cv2.findContours(doubled, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return []
+        
+        shapes = {}
+        holes = []
+        for index, (contour, links) in enumerate(zip(contours, hierarchy[0])):
+            polygon = cv2.approxPolyDP(contour, 2 * self.tolerance, True).reshape(-1, 2) / 2
+            if len(polygon) < 3:
+                continue
+            if links[3] < 0:
+                shapes[index] = [polygon]
+            else:
+                holes.append((links[3], polygon))
+        
+        # Holes of a dropped outer ring go with it
+        for parent, polygon in holes:
+            if parent in shapes:
+                shapes[parent].append(polygon)
+        return list(shapes.values())
+    
+    def trace(self, label_map: LabelMap,
+              progress: Optional[Callable[[float], None]] = None) -> List[List[Shape]]:
+        """Outlines of every layer; cv2 releases the GIL, so layers are traced in parallel"""
+        layer_count = len(label_map)
+        layers = [None] * layer_count
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.trace_layer, label_map.labels, layer): layer
+                       for layer in range(layer_count)}
+            for done, future in enumerate(futures, start=1):
+                layers[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done / layer_count)
+        return layers
+    
+    def export(self, label_map: LabelMap, file_path: Path,
+               progress: Optional[Callable[[float], None]] = None) -> Path:
+        """Write outlines as .svg or .dxf depending on the file extension"""
+        suffix = file_path.suffix.lower()
+        if suffix not in ('.svg', '.dxf'):
+            raise InvalidImageException(f"Outline export supports .svg and .dxf, not {suffix or file_path.name}")
+        
+        layers = self.trace(label_map, progress)
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, 'w', encoding='ascii', newline='\n') as handle:
+                if suffix == '.svg':
+                    self._write_svg(handle, label_map, layers)
+                else:
+                    self._write_dxf(handle, label_map, layers)
+        except OSError as e:
+            raise InvalidImageException(f"Outline export failed: {str(e)}")
+        return file_path
+    
+    def _write_svg(self, handle: TextIO, label_map: LabelMap, layers: List[List[Shape]]) -> None:
+        height, width = label_map.dimensions
+        scale = self.pixel_size or 1.0
+        unit = "mm" if self.pixel_size else ""
+        handle.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale:g}{unit}" '
+                     f'height="{height * scale:g}{unit}" viewBox="0 0 {width} {height}">\n')
+        for index, (color, shapes) in enumerate(zip(label_map.palette.colors, layers), start=1):
+            handle.write(f'<g id="layer{index:02d}_{color.hex[1:]}" fill="{color.hex}" fill-rule="evenodd">\n')
+            for shape in shapes:
+                path = " ".join("M" + " ".join(f"{x:g},{y:g}" for x, y in ring) + "Z" for ring in shape)
+                handle.write(f'<path d="{path}"/>\n')
+            handle.write('</g>\n')
+        handle.write('</svg>\n')
+    
+    def _write_dxf(self, handle: TextIO, label_map: LabelMap, layers: List[List[Shape]]) -> None:
+        for code, value in self._dxf_groups(label_map, layers):
+            handle.write(f"{code}\n{value}\n")
+    
+    def _dxf_groups(self, label_map: LabelMap, layers: List[List[Shape]]) -> Iterator[Tuple[int, object]]:
+        """Minimal R12 DXF: one layer per color, closed POLYLINEs, y axis pointing up"""
+        height = label_map.dimensions[0]
+        scale = self.pixel_size or 1.0
+        names = [f"LAYER{index:02d}_{color.hex[1:].upper()}"
+                 for index, color in enumerate(label_map.palette.colors, start=1)]
+        
+        yield from [(0, "SECTION"), (2, "TABLES"), (0, "TABLE"), (2, "LAYER"), (70, len(names))]
+        for name, color in zip(names, label_map.palette.colors):
+            # True color (group 420) is R2004 and later; R12 layers carry an ACI index only
+            yield from [(0, "LAYER"), (2, name), (70, 0), (62, nearest_aci(color)), (6, "CONTINUOUS")]
+        yield from [(0, "ENDTAB"), (0, "ENDSEC"), (0, "SECTION"), (2, "ENTITIES")]
+        
+        for name, shapes in zip(names, layers):
+            for ring in (ring for shape in shapes for ring in shape):
+                yield from [(0, "POLYLINE"), (8, name), (66, 1), (70, 1)]
+                for x, y in ring:
+                    yield from [(0, "VERTEX"), (8, name), (10, f"{x * scale:g}"), (20, f"{(height - y) * scale:g}")]
+                yield from [(0, "SEQEND"), (8, name)]
+        yield from [(0, "ENDSEC"), (0, "EOF")]
\ No newline at end of file
@@ -0,0 +1,268 @@
+import io
+import os
+import struct
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+import cv2
+import numpy as np
+from PIL import Image as PILImage, ImageSequence
+from domain import InvalidImageException
+from infrastructure import ColorAnalyzer
+
+VIDEO_CODECS = {'.mp4': 'mp4v', '.avi': 'MJPG', '.mov': 'mp4v', '.mkv': 'XVID'}
+VIDEO_EXTENSIONS = set(VIDEO_CODECS) | {'.webm'}
+ANIMATION_EXTENSIONS = {'.gif', '.webp', '.apng'}
+CLIP_EXTENSIONS = VIDEO_EXTENSIONS | ANIMATION_EXTENSIONS
+
+# Frame pixels (RGB) and how long the frame is shown
+Frame = Tuple[np.ndarray, int]
+
+class FrameReader:
+    """Decodes an animation (Pillow) or a video (OpenCV) one frame at a time; iterable more than once"""
+    
+    DEFAULT_DURATION_MS = 100
+    
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self.is_video = file_path.suffix.lower() in VIDEO_EXTENSIONS
+        try:
+            if self.is_video:
+                capture = self._open_capture()
+                self.width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self.height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                self.frame_count = max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+                fps = capture.get(cv2.CAP_PROP_FPS)
+                self.duration_ms = int(round(1000 / fps)) if fps and fps > 0 else self.DEFAULT_DURATION_MS
+                capture.release()
+            else:
+                with PILImage.open(file_path) as animation:
+                    self.width, self.height = animation.size
+                    self.frame_count = getattr(animation, 'n_frames', 1)
+                    self.duration_ms = animation.info.get('duration') or self.DEFAULT_DURATION_MS
+        except InvalidImageException:
+            raise
+        except Exception as e:
+            raise InvalidImageException(f"Failed to open clip {file_path}: {str(e)}")
+    
+    def _open_capture(self) -> cv2.VideoCapture:
+        capture = cv2.VideoCapture(str(self.file_path))
+        if not capture.isOpened():
+            raise InvalidImageException(f"Cannot decode video: {self.file_path}")
+        return capture
+    
+    def __iter__(self) -> Iterator[Frame]:
+        if self.is_video:
+            capture = self._open_capture()
+            try:
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame), self.duration_ms
+            finally:
+                capture.release()
+        else:
+            with PILImage.open(self.file_path) as animation:
+                for frame in ImageSequence.Iterator(animation):
+                    # Pillow composites partial GIF frames onto the canvas, so every frame is complete
+                    duration = frame.info.get('duration') or self.duration_ms
+                    yield np.asarray(frame.convert('RGB')), duration
+
+class GifStreamWriter:
+    """Animated GIF written frame by frame; Pillow LZW-encodes each frame, nothing else is kept"""
+    
+    def __init__(self, file_path: Path, width: int, height: int, loop: int = 0):
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.frames_written = 0
+        self._temp_path = file_path.with_name(file_path.name + ".part")
+        self._handle = open(self._temp_path, 'wb')
+        
+        # Header and a logical screen without a global color table: every frame carries its own
+        self._handle.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0))
+        self._handle.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00')
+    
+    def write_frame(self, indices: np.ndarray, colors: np.ndarray, duration_ms: int) -> None:
+        """Append a frame given as palette indices and its (at most 256) RGB colors"""
+        if indices.shape != (self.height, self.width):
+            raise InvalidImageException(f"Frame of shape {indices.shape} does not fit {self.file_path}")
+        frame = PILImage.fromarray(np.ascontiguousarray(indices, dtype=np.uint8))
+        frame.putpalette(np.ascontiguousarray(colors, dtype=np.uint8).tobytes())
+        encoded = io.BytesIO()
+        frame.save(encoded, format='GIF', optimize=False, interlace=False)
+        color_table, interlace, image_data = self._split_frame(encoded.getvalue())
+        
+        delay = max(0, int(round(duration_ms / 10)))
+        self._handle.write(b'\x21\xf9\x04' + struct.pack('<BHB', 0b100, delay, 0) + b'\x00')
+        table_bits = max(0, (len(color_table) // 3).bit_length() - 2)
+        self._handle.write(b'\x2c' + struct.pack('<HHHHB', 0, 0, self.width, self.height, 0x80 | interlace | table_bits))
+        self._handle.write(color_table)
+        self._handle.write(image_data)
+        self.frames_written += 1
+    
+    @staticmethod
+    def _split_frame(data: bytes) -> Tuple[bytes, int, bytes]:
+        """Color table, interlace flag and LZW image data (code size and sub-blocks) of a single-frame GIF"""
+        flags = data[10]
+        position = 13
+        color_table = b''
+        if flags & 0x80:
+            table_size = 3 << ((flags & 0x07) + 1)
+            color_table = data[position:position + table_size]
+            position += table_size
+        
+        while data[position] == 0x21:
+            # Skip extension blocks: introducer, label, then sub-blocks up to the zero terminator
+            position += 2
+            while data[position]:
+                position += data[position] + 1
+            position += 1
+        if data[position] != 0x2c:
+            raise InvalidImageException("Unexpected block in encoded GIF frame")
+        
+        image_flags = data[position + 9]
+        position += 10
+        if image_flags & 0x80:
+            table_size = 3 << ((image_flags & 0x07) + 1)
+            color_table = data[position:position + table_size]
+            position += table_size
+        
+        end = position + 1
+        while data[end]:
+            end += data[end] + 1
+        return color_table, image_flags & 0x40, data[position:end + 1]
+    
+    def close(self) -> None:
+        """Finish the file; it only appears under its final name once complete"""
+        if self.frames_written == 0:
+            self.abort()
+            raise InvalidImageException(f"No frames written to {self.file_path}")
+        self._handle.write(b'\x3b')
+        self._handle.close()
+        os.replace(self._temp_path, self.file_path)
+    
+    def abort(self) -> None:
+        """Discard a partially written file"""
+        self._handle.close()
+        self._temp_path.unlink(missing_ok=True)
+    
+    def __enter__(self) -> 'GifStreamWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class VideoFrameWriter:
+    """Video written frame by frame through OpenCV; frames are expanded from indices to colors"""
+    
+    def __init__(self, file_path: Path, width: int, height: int, duration_ms: int):
+        suffix = file_path.suffix.lower()
+        if suffix not in VIDEO_CODECS:
+            raise InvalidImageException(f"Video output supports {', '.join(sorted(VIDEO_CODECS))}, not {suffix}")
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.frames_written = 0
+        # The container is chosen from the extension, so the temporary name keeps it
+        self._temp_path = file_path.with_name(f"{file_path.stem}.part{file_path.suffix}")
+        fps = 1000 / max(1, duration_ms)
+        self._writer = cv2.VideoWriter(str(self._temp_path), cv2.VideoWriter_fourcc(*VIDEO_CODECS[suffix]),
+                                       fps, (width, height))
+        if not self._writer.isOpened():
+            raise InvalidImageException(f"Cannot encode video: {file_path}")
+    
+    def write_frame(self, indices: np.ndarray, colors: np.ndarray, duration_ms: int) -> None:
+        """Append a frame; videos have a fixed frame rate, so the duration is ignored"""
+        bgr_colors = np.ascontiguousarray(colors[:, ::-1], dtype=np.uint8)
+        self._writer.write(bgr_colors[indices])
+        self.frames_written += 1
+    
+    def close(self) -> None:
+        self._writer.release()
+        if self.frames_written == 0:
+            self.abort()
+            raise InvalidImageException(f"No frames written to {self.file_path}")
+        os.replace(self._temp_path, self.file_path)
+    
+    def abort(self) -> None:
+        self._writer.release()
+        self._temp_path.unlink(missing_ok=True)
+    
+    def __enter__(self) -> 'VideoFrameWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def open_frame_writer(file_path: Path, width: int, height: int, duration_ms: int):
+    """GIF or video writer depending on the file extension"""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    if file_path.suffix.lower() == '.gif':
+        return GifStreamWriter(file_path, width, height)
+    return VideoFrameWriter(file_path, width, height, duration_ms)
+
+class RunningHistogram:
+    """Dense color histogram accumulated over frames; its size depends on the bin depth, not the clip length"""
+    
+    def __init__(self, bits: int = 6):
+        self.bits = bits
+        size = 1 << (3 * bits)
+        self.counts = np.zeros(size, dtype=np.float64)
+        self.sums = np.zeros((size, 3), dtype=np.float64)
+    
+    def add(self, pixels: np.ndarray) -> None:
+        """Count the pixels of one (downsampled) frame"""
+        flat = pixels.reshape(-1, 3)
+        codes = ColorAnalyzer._pack_colors(flat, self.bits)
+        size = len(self.counts)
+        self.counts += np.bincount(codes, minlength=size)
+        for channel in range(3):
+            self.sums[:, channel] += np.bincount(codes, weights=flat[:, channel], minlength=size)
+    
+    def decay(self, factor: float) -> None:
+        """Fade earlier frames so a refitted palette follows the current scene"""
+        self.counts *= factor
+        self.sums *= factor
+    
+    def normalize(self) -> None:
+        """Scale to a total weight of one, so every input counts the same once histograms are merged"""
+        total = self.counts.sum()
+        if total > 0:
+            self.decay(1 / total)
+    
+    def occupied(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Codes, weights and channel sums of the occupied bins; compact enough to send between processes"""
+        codes = np.flatnonzero(self.counts)
+        return codes, self.counts[codes], self.sums[codes]
+    
+    def merge(self, codes: np.ndarray, counts: np.ndarray, sums: np.ndarray) -> None:
+        """Add the occupied bins of a histogram with the same bin depth"""
+        self.counts[codes] += counts
+        self.sums[codes] += sums
+    
+    def colors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Mean color and weight of every occupied bin, the input quantizers fit"""
+        occupied = np.flatnonzero(self.counts)
+        counts = self.counts[occupied]
+        return self.sums[occupied] / counts[:, None], counts
+
+def match_order(previous: Optional[np.ndarray], centers: np.ndarray) -> np.ndarray:
+    """Reorder refitted centers so each keeps the slot of the closest previous center (stable layers)"""
+    if previous is None or len(previous) != len(centers):
+        return centers
+    distances = np.sum((previous[:, None, :].astype(np.float64) - centers[None, :, :]) ** 2, axis=2)
+    order = np.empty(len(centers), dtype=np.intp)
+    # Greedy on the globally closest pairs; palettes are at most a few dozen colors
+    for _ in range(len(centers)):
+        slot, center = np.unravel_index(np.argmin(distances), distances.shape)
+        order[slot] = center
+        distances[slot, :] = np.inf
+        distances[:, center] = np.inf
+    return centers[order]
\ No newline at end of file
@@ -1,24 +1,178 @@
 import cv2
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import weakref
+import zlib
 import numpy as np
+from collections import OrderedDict
+from PIL import Image as PILImage
 from pathlib import Path
-from sklearn.cluster import KMeans
-from domain import Image, RGBColor, ColorPalette, InvalidImageException, ColorProcessingException
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from domain import Image, RGBColor, ColorPalette, LabelMap, Project, InvalidImageException, ColorProcessingException
+from quantizers import create_quantizer, DEFAULT_PRESET
+from colorspaces import color_space
+from dithering import create_ditherer
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+class PngStripWriter:
+    """Image sink that encodes a PNG strip by strip, so memory is bounded by the strip size"""
+    
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    
+    def __init__(self, file_path: Path, width: int, height: int, channels: int = 3, compression_level: int = 6,
+                 bit_depth: int = 8, indexed: bool = False):
+        if channels not in (1, 3) or (indexed and channels != 1):
+            raise InvalidImageException(f"PNG output needs 1 or 3 channels (1 when indexed), got {channels}")
+        if bit_depth not in (1, 8) or (bit_depth == 1 and channels != 1):
+            raise InvalidImageException(f"Unsupported PNG bit depth {bit_depth} for {channels} channels")
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.indexed = indexed
+        self.row_bytes = (width * channels * bit_depth + 7) // 8
+        self.rows_written = 0
+        self._palette_written = False
+        self._temp_path = file_path.with_name(file_path.name + ".part")
+        self._compressor = zlib.compressobj(compression_level)
+        self._handle = open(self._temp_path, 'wb')
+        
+        color_type = 3 if indexed else 2 if channels == 3 else 0
+        self._handle.write(self.SIGNATURE)
+        self._chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0))
+    
+    def write_palette(self, colors: np.ndarray) -> None:
+        """Set the colors of an indexed PNG; rows are then palette indices. Must precede the first strip"""
+        if not self.indexed or self._palette_written:
+            raise InvalidImageException(f"Palette not expected for {self.file_path}")
+        if not 1 <= len(colors) <= 256:
+            raise InvalidImageException(f"Indexed PNG needs 1 to 256 colors, got {len(colors)}")
+        self._chunk(b'PLTE', np.ascontiguousarray(colors, dtype=np.uint8).tobytes())
+        self._palette_written = True
+    
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._handle.write(struct.pack(">I", len(data)))
+        self._handle.write(kind)
+        self._handle.write(data)
+        self._handle.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+    
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Append the next band of rows (top to bottom); 1-bit rows come packed (np.packbits)"""
+        rows = rows.reshape(len(rows), -1)
+        if rows.shape[1] != self.row_bytes or self.rows_written + len(rows) > self.height:
+            raise InvalidImageException(f"Strip of shape {rows.shape} does not fit {self.file_path}")
+        if self.indexed and not self._palette_written:
+            raise InvalidImageException(f"Palette must be written before the rows of {self.file_path}")
+        
+        # Filter type 0 per scanline: flat reduced-color images compress well without prediction
+        scanlines = np.zeros((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        scanlines[:, 1:] = rows
+        data = self._compressor.compress(scanlines.data)
+        if data:
+            self._chunk(b'IDAT', data)
+        self.rows_written += len(rows)
+    
+    def close(self) -> None:
+        """Finish the file; it only appears under its final name once complete"""
+        if self.rows_written != self.height:
+            self.abort()
+            raise InvalidImageException(
+                f"Incomplete image: {self.rows_written} of {self.height} rows written to {self.file_path}"
+            )
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self._handle.close()
+        os.replace(self._temp_path, self.file_path)
+    
+    def abort(self) -> None:
+        """Discard a partially written file"""
+        self._handle.close()
+        self._temp_path.unlink(missing_ok=True)
+    
+    def __enter__(self) -> 'PngStripWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class NpyStripWriter:
+    """Image sink backed by a memory-mapped .npy file"""
+    
+    def __init__(self, file_path: Path, width: int, height: int, channels: int = 3):
+        self.file_path = file_path
+        self.height = height
+        self.rows_written = 0
+        self._temp_path = file_path.with_name(file_path.name + ".part")
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        self._array = np.lib.format.open_memmap(self._temp_path, mode='w+', dtype=np.uint8, shape=shape)
+    
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Append the next band of rows (top to bottom)"""
+        self._array[self.rows_written:self.rows_written + len(rows)] = rows
+        self.rows_written += len(rows)
+    
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            self.abort()
+            raise InvalidImageException(
+                f"Incomplete image: {self.rows_written} of {self.height} rows written to {self.file_path}"
+            )
+        self._array.flush()
+        del self._array
+        os.replace(self._temp_path, self.file_path)
+    
+    def abort(self) -> None:
+        del self._array
+        self._temp_path.unlink(missing_ok=True)
+    
+    def __enter__(self) -> 'NpyStripWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
 
 class ImageRepository:
     """Infrastructure service for image I/O operations"""
     
+    STRIP_BYTES = 16 * 1024 * 1024
+    # Scaled decoding: JPEG skips the DCT detail a downsample would discard, other formats resize on load
+    REDUCED_MODES = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+    
+    def __init__(self, memory_map_threshold_mb: float = 512.0, scratch_dir: Optional[Path] = None):
+        self.memory_map_threshold_bytes = int(memory_map_threshold_mb * 1024 * 1024)
+        self.scratch_dir = scratch_dir
+    
     def load(self, file_path: Path) -> Image:
         """Load image from file with proper error handling"""
         try:
             if not file_path.exists():
                 raise InvalidImageException(f"File not found: {file_path}")
             
+            if file_path.suffix.lower() == '.npy':
+                # Raw RGB arrays are mapped, not read: stages stream them tile by tile
+                image_array = np.load(file_path, mmap_mode='r', allow_pickle=False)
+                if image_array.dtype != np.uint8 or image_array.ndim != 3 or image_array.shape[2] != 3:
+                    raise InvalidImageException(f"Expected an HxWx3 uint8 array: {file_path}")
+                return Image(file_path, image_array)
+            
             image_array = cv2.imread(str(file_path))
             if image_array is None:
                 raise InvalidImageException(f"Unsupported image format: {file_path}")
             
-            # Convert BGR to RGB
-            image_array = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+            # Convert BGR to RGB in place instead of holding two copies
+            cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB, dst=image_array)
+            if image_array.nbytes > self.memory_map_threshold_bytes:
+                image_array = self._spill(image_array)
             return Image(file_path, image_array)
             
         except Exception as e:
@@ -26,10 +180,100 @@ class ImageRepository:
                 raise
             raise InvalidImageException(f"Failed to load image: {str(e)}")
     
+    def load_reduced(self, file_path: Path, max_dimension: int) -> Image:
+        """Load at a power-of-two scale that keeps at least max_dimension, for analysis-only passes"""
+        if file_path.suffix.lower() == '.npy':
+            return self.load(file_path)
+        try:
+            # Only the header is read here
+            with PILImage.open(file_path) as header:
+                width, height = header.size
+        except Exception:
+            return self.load(file_path)
+        
+        factor = 1
+        while factor < 8 and max(width, height) // (2 * factor) >= max_dimension:
+            factor *= 2
+        if factor == 1:
+            return self.load(file_path)
+        image_array = cv2.imread(str(file_path), self.REDUCED_MODES[factor])
+        if image_array is None:
+            return self.load(file_path)
+        cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB, dst=image_array)
+        return Image(file_path, image_array)
+    
+    def decode(self, data: bytes, file_path: Path = Path("upload")) -> Image:
+        """Decode an image received in memory (e.g. over HTTP); file_path only names it"""
+        try:
+            image_array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error as e:
+            raise InvalidImageException(f"Failed to decode image: {str(e)}")
+        if image_array is None:
+            raise InvalidImageException(f"Unsupported image format: {file_path}")
+        cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB, dst=image_array)
+        if image_array.nbytes > self.memory_map_threshold_bytes:
+            image_array = self._spill(image_array)
+        return Image(file_path, image_array)
+    
+    def encode(self, pixels: np.ndarray, extension: str = ".png") -> bytes:
+        """Encode an RGB image in memory"""
+        success, encoded = cv2.imencode(extension, cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR))
+        if not success:
+            raise InvalidImageException(f"Failed to encode image as {extension}")
+        return encoded.tobytes()
+    
+    def _spill(self, pixels: np.ndarray) -> np.ndarray:
+        """Move a decoded image into a scratch memory map so it no longer occupies RAM"""
+        handle, temp_name = tempfile.mkstemp(suffix=".npy", dir=self.scratch_dir)
+        os.close(handle)
+        mapped = np.lib.format.open_memmap(temp_name, mode='w+', dtype=pixels.dtype, shape=pixels.shape)
+        mapped[:] = pixels
+        mapped.flush()
+        
+        try:
+            # POSIX keeps the mapping valid after unlink; elsewhere remove it once the map is released
+            os.remove(temp_name)
+        except OSError:
+            weakref.finalize(mapped, self._remove_quietly, temp_name)
+        return mapped
+    
+    @staticmethod
+    def _remove_quietly(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def strip_rows(self, width: int, channels: int = 3) -> int:
+        """Rows per strip when streaming an image to or from disk"""
+        return max(1, self.STRIP_BYTES // max(1, width * channels))
+    
+    def open_sink(self, file_path: Path, width: int, height: int, channels: int = 3, indexed: bool = False):
+        """Writer that accepts an image top to bottom in strips (.png or .npy); indexed PNGs take a palette first"""
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = file_path.suffix.lower()
+        if suffix == '.png':
+            return PngStripWriter(file_path, width, height, 1 if indexed else channels, indexed=indexed)
+        if indexed:
+            raise InvalidImageException(f"Indexed output is only supported for .png, not {suffix or file_path.name}")
+        if suffix == '.npy':
+            return NpyStripWriter(file_path, width, height, channels)
+        raise InvalidImageException(f"Streaming output supports .png and .npy, not {suffix or file_path.name}")
+    
     def save(self, pixels: np.ndarray, file_path: Path) -> None:
         """Save image to file"""
         try:
             file_path.parent.mkdir(parents=True, exist_ok=True)
+            if file_path.suffix.lower() in ('.png', '.npy'):
+                # Streamed in strips: no whole-image BGR copy
+                height, width = pixels.shape[:2]
+                channels = pixels.shape[2] if pixels.ndim == 3 else 1
+                rows = self.strip_rows(width, channels)
+                with self.open_sink(file_path, width, height, channels) as sink:
+                    for top in range(0, height, rows):
+                        sink.write_rows(pixels[top:top + rows])
+                return
+            
             # Convert RGB to BGR for OpenCV
             save_pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
             success = cv2.imwrite(str(file_path), save_pixels)
@@ -37,29 +281,218 @@ class ImageRepository:
                 raise InvalidImageException(f"Failed to save image: {file_path}")
         except Exception as e:
             raise InvalidImageException(f"Save failed: {str(e)}")
+    
+    def save_indexed(self, label_map: LabelMap, file_path: Path) -> None:
+        """Save a label map as an 8-bit palettized PNG: one byte per pixel, only the label map's colors"""
+        try:
+            height, width = label_map.dimensions
+            colors = np.array([color.tuple for color in label_map.palette.colors], dtype=np.uint8)
+            rows = self.strip_rows(width, 1)
+            with self.open_sink(file_path, width, height, indexed=True) as sink:
+                sink.write_palette(colors)
+                for top in range(0, height, rows):
+                    sink.write_rows(label_map.labels[top:top + rows])
+        except Exception as e:
+            raise InvalidImageException(f"Save failed: {str(e)}")
+
+
+class PaletteRepository:
+    """Infrastructure service for filament palette files"""
+    
+    def load(self, file_path: Path) -> ColorPalette:
+        """Load a palette from JSON (hex strings or RGB triples) or text (one color per line, then a name)"""
+        try:
+            text = file_path.read_text(encoding='utf-8')
+            if file_path.suffix.lower() == '.json':
+                entries = json.loads(text)
+                if isinstance(entries, dict):
+                    entries = entries.get('colors', [])
+            else:
+                entries = [line.split()[0] for line in text.splitlines() if line.strip()]
+            
+            return ColorPalette(tuple(self._parse_color(entry) for entry in entries))
+            
+        except Exception as e:
+            raise ColorProcessingException(f"Failed to load palette {file_path}: {str(e)}")
+    
+    def save(self, palette: ColorPalette, file_path: Path) -> None:
+        """Save a palette as a JSON list of hex strings"""
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(json.dumps([color.hex for color in palette.colors], indent=2), encoding='utf-8')
+    
+    @staticmethod
+    def _parse_color(entry) -> RGBColor:
+        if isinstance(entry, str):
+            if ',' in entry:
+                return RGBColor.from_tuple(tuple(int(part) for part in entry.split(',')))
+            return RGBColor.from_hex(entry)
+        return RGBColor.from_tuple(tuple(int(part) for part in entry))
+
+class ProjectRepository:
+    """Infrastructure service for project files: a compressed .npz that reopens without the source image"""
+    
+    VERSION = 1
+    
+    def save(self, project: Project, file_path: Path) -> None:
+        """Write the project atomically; labels of a reduced image compress to a small fraction of the PNG"""
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = file_path.with_name(file_path.name + ".part")
+            with open(temp_path, 'wb') as handle:
+                np.savez_compressed(
+                    handle,
+                    version=np.array(self.VERSION),
+                    labels=np.ascontiguousarray(project.labels, dtype=np.uint8),
+                    palette=np.array([color.tuple for color in project.palette.colors], dtype=np.uint8),
+                    output_colors=np.array([color.tuple for color in project.output_colors.colors], dtype=np.uint8),
+                    source_fingerprint=np.array(project.source_fingerprint),
+                    source_path=np.array(str(project.source_path)),
+                    settings=np.array(json.dumps(project.settings)),
+                )
+            os.replace(temp_path, file_path)
+        except Exception as e:
+            raise InvalidImageException(f"Failed to save project {file_path}: {str(e)}")
+    
+    def load(self, file_path: Path) -> Project:
+        """Read a project file written by save"""
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                version = int(data['version'])
+                if version > self.VERSION:
+                    raise InvalidImageException(f"Project version {version} is newer than supported ({self.VERSION})")
+                labels = data['labels']
+                palette, output_colors = data['palette'], data['output_colors']
+                if labels.ndim != 2 or labels.size and int(labels.max()) >= len(palette):
+                    raise InvalidImageException("Labels do not match the palette")
+                return Project(
+                    labels=labels,
+                    palette=ColorAnalyzer._to_palette(palette),
+                    output_colors=ColorAnalyzer._to_palette(output_colors),
+                    source_fingerprint=str(data['source_fingerprint']),
+                    source_path=Path(str(data['source_path'])),
+                    settings=json.loads(str(data['settings'])),
+                )
+        except Exception as e:
+            raise InvalidImageException(f"Failed to load project {file_path}: {str(e)}")
 
 class ColorAnalyzer:
     """Infrastructure service for color analysis algorithms"""
     
-    def find_dominant_colors(self, image: Image, color_count: int) -> ColorPalette:
-        """Use K-means clustering to find dominant colors"""
+    RESIZE_BAND_BYTES = 64 * 1024 * 1024
+    
+    def __init__(self, analysis_max_dimension: int = 800, max_histogram_colors: int = 65536,
+                 histogram_bits: int = 6, quantizer: str = "kmeans",
+                 instrumentation: Optional[Instrumentation] = None, preset: str = DEFAULT_PRESET):
+        self.analysis_max_dimension = analysis_max_dimension
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.quantizer = quantizer
+        self.preset = preset
+        self.max_histogram_colors = max_histogram_colors
+        self.histogram_bits = histogram_bits
+    
+    def cache_token(self, quantizer: Optional[str] = None, preset: Optional[str] = None) -> str:
+        """Identify the analysis settings that affect a fitted palette"""
+        return (f"{quantizer or self.quantizer}:{preset or self.preset}:{self.analysis_max_dimension}:"
+                f"{self.max_histogram_colors}:{self.histogram_bits}")
+    
+    def find_dominant_colors(self, image: Image, color_count: int, quantizer: Optional[str] = None,
+                             preset: Optional[str] = None) -> ColorPalette:
+        """Quantize the weighted color histogram (K-means by default) to find dominant colors"""
         try:
             # Resize large images for performance
-            processed_image = self._prepare_image(image, max_dimension=800)
-            pixels = processed_image.pixels.reshape(-1, 3)
+            with self.instrumentation.stage("prepare_image", pixels=image.total_pixels):
+                processed_image = self._prepare_image(image, max_dimension=self.analysis_max_dimension)
+            with self.instrumentation.stage("histogram", pixels=processed_image.total_pixels) as stage:
+                colors, counts = self._color_histogram(processed_image.pixels.reshape(-1, 3))
+                stage['distinct_colors'] = len(colors)
             
-            kmeans = KMeans(n_clusters=color_count, random_state=42, n_init=10)
-            kmeans.fit(pixels)
+            return self.fit_histogram(colors, counts, color_count, quantizer, preset)
             
-            dominant_colors = [
-                RGBColor.from_tuple(tuple(map(int, color)))
-                for color in kmeans.cluster_centers_
-            ]
+        except Exception as e:
+            raise ColorProcessingException(f"Color analysis failed: {str(e)}")
+    
+    def fit_histogram(self, colors: np.ndarray, counts: np.ndarray, color_count: int,
+                      quantizer: Optional[str] = None, preset: Optional[str] = None) -> ColorPalette:
+        """Palette from a weighted color histogram, e.g. one accumulated over the frames of a clip"""
+        # Fewer distinct colors than requested: they already are the palette
+        if len(colors) <= color_count:
+            centers = colors[np.argsort(-counts, kind='stable')]
+        else:
+            backend = create_quantizer(quantizer or self.quantizer, preset or self.preset)
+            with self.instrumentation.stage("fit", quantizer=backend.name, color_count=color_count,
+                                            distinct_colors=len(colors)) as stage:
+                centers = backend.fit(colors, counts, color_count)
+                stage['iterations'] = backend.iterations
+                if getattr(backend, 'restarts', None) is not None:
+                    stage['restarts'] = backend.restarts
+        
+        return self._to_palette(centers)
+    
+    def sweep_dominant_colors(self, image: Image, max_colors: int, quantizer: Optional[str] = None,
+                              preset: Optional[str] = None) -> Dict[int, ColorPalette]:
+        """Palettes for every color count from 1 to max_colors in one pass over the histogram"""
+        try:
+            with self.instrumentation.stage("prepare_image", pixels=image.total_pixels):
+                processed_image = self._prepare_image(image, max_dimension=self.analysis_max_dimension)
+            with self.instrumentation.stage("histogram", pixels=processed_image.total_pixels) as stage:
+                colors, counts = self._color_histogram(processed_image.pixels.reshape(-1, 3))
+                stage['distinct_colors'] = len(colors)
+            distinct = colors[np.argsort(-counts, kind='stable')]
             
-            return ColorPalette(tuple(dominant_colors))
+            palettes = {}
+            fitted_max = min(max_colors, len(colors) - 1)
+            if fitted_max >= 1:
+                backend = create_quantizer(quantizer or self.quantizer, preset or self.preset)
+                with self.instrumentation.stage("fit_sweep", quantizer=backend.name, max_colors=fitted_max,
+                                                distinct_colors=len(colors)) as stage:
+                    fitted = backend.fit_sweep(colors, counts, fitted_max)
+                    stage['iterations'] = backend.iterations
+                for color_count, centers in fitted.items():
+                    palettes[color_count] = self._to_palette(centers)
+            for color_count in range(fitted_max + 1, max_colors + 1):
+                palettes[color_count] = self._to_palette(distinct[:color_count])
+            
+            return palettes
             
         except Exception as e:
-            raise ColorProcessingException(f"Color analysis failed: {str(e)}")
+            raise ColorProcessingException(f"Color sweep failed: {str(e)}")
+    
+    @staticmethod
+    def _to_palette(centers: np.ndarray) -> ColorPalette:
+        dominant_colors = [
+            RGBColor.from_tuple(tuple(map(int, color)))
+            for color in centers
+        ]
+        return ColorPalette(tuple(dominant_colors))
+    
+    def _color_histogram(self, pixels: np.ndarray):
+        """Collapse pixels to distinct colors with counts, quantizing when there are too many"""
+        bits = 8
+        codes = self._pack_colors(pixels, bits)
+        unique_codes, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        
+        while len(unique_codes) > self.max_histogram_colors and bits > 1:
+            # Photographic content: bin into a coarser grid, keeping the mean color of each bin
+            bits = min(bits - 1, self.histogram_bits)
+            codes = self._pack_colors(pixels, bits)
+            unique_codes, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        
+        inverse = inverse.ravel()
+        colors = np.stack([
+            np.bincount(inverse, weights=pixels[:, channel], minlength=len(unique_codes))
+            for channel in range(3)
+        ], axis=1) / counts[:, None]
+        
+        return colors, counts
+    
+    @staticmethod
+    def _pack_colors(pixels: np.ndarray, bits: int) -> np.ndarray:
+        """Pack the top bits of each RGB channel into a single integer code"""
+        shift = 8 - bits
+        codes = (pixels[:, 0].astype(np.int32) >> shift) << (2 * bits)
+        codes |= (pixels[:, 1].astype(np.int32) >> shift) << bits
+        codes |= pixels[:, 2].astype(np.int32) >> shift
+        return codes
     
     def _prepare_image(self, image: Image, max_dimension: int = 1000) -> Image:
         """Resize image if too large while maintaining aspect ratio"""
@@ -75,14 +508,27 @@ class ColorAnalyzer:
             new_height = max_dimension
             new_width = int(width * (max_dimension / height))
         
-        resized_pixels = cv2.resize(
-            image.pixels, 
-            (new_width, new_height), 
-            interpolation=cv2.INTER_AREA
-        )
+        resized_pixels = self._resize(image.pixels, new_width, new_height)
         
         return Image(image.file_path, resized_pixels)
     
+    def _resize(self, pixels: np.ndarray, new_width: int, new_height: int) -> np.ndarray:
+        """Area downsample; large (e.g. memory-mapped) images are read in bands of output rows"""
+        height, width = pixels.shape[:2]
+        if pixels.nbytes <= self.RESIZE_BAND_BYTES:
+            return cv2.resize(pixels, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        
+        result = np.empty((new_height, new_width) + pixels.shape[2:], dtype=pixels.dtype)
+        scale = height / new_height
+        band = max(1, int(self.RESIZE_BAND_BYTES / (scale * pixels.strides[0])))
+        for out_top in range(0, new_height, band):
+            out_bottom = min(out_top + band, new_height)
+            top, bottom = round(out_top * scale), round(out_bottom * scale)
+            result[out_top:out_bottom] = cv2.resize(
+                pixels[top:bottom], (new_width, out_bottom - out_top), interpolation=cv2.INTER_AREA
+            ).reshape(result[out_top:out_bottom].shape)
+        return result
+    
     def create_thumbnail(self, pixels: np.ndarray, max_size: int = 400) -> np.ndarray:
         """Create thumbnail for display"""
         height, width = pixels.shape[:2]
@@ -97,4 +543,310 @@ class ColorAnalyzer:
             new_height = max_size
             new_width = int(width * (max_size / height))
         
-        return cv2.resize(pixels, (new_width, new_height), interpolation=cv2.INTER_AREA)
\ No newline at end of file
+        return self._resize(pixels, new_width, new_height)
+
+class DisplayCache:
+    """Display renderings keyed by source array and target box, so redraws skip the resize"""
+    
+    def __init__(self, color_analyzer: ColorAnalyzer, max_entries: int = 8):
+        self.color_analyzer = color_analyzer
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+    
+    @staticmethod
+    def fit(height: int, width: int, box_width: int, box_height: int) -> Tuple[int, int]:
+        """Largest (width, height) with the image's aspect ratio that fits the box"""
+        scale = min(box_width / width, box_height / height)
+        return max(1, int(width * scale)), max(1, int(height * scale))
+    
+    def render(self, pixels: np.ndarray, box_width: int, box_height: int) -> np.ndarray:
+        """Pixels scaled to fit the box (pixels are treated as immutable)"""
+        height, width = pixels.shape[:2]
+        size = self.fit(height, width, box_width, box_height)
+        key = (id(pixels),) + size
+        entry = self._entries.get(key)
+        if entry is not None and entry[0]() is pixels:
+            self._entries.move_to_end(key)
+            return entry[1]
+        
+        if size == (width, height):
+            rendered = pixels
+        elif size[0] < width:
+            rendered = self.color_analyzer._resize(pixels, *size)
+        else:
+            # Enlarged previews keep their flat color regions crisp
+            rendered = cv2.resize(pixels, size, interpolation=cv2.INTER_NEAREST)
+        
+        self._entries[key] = (weakref.ref(pixels), rendered)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return rendered
+
+class PaletteLookupTable:
+    """Quantized RGB grid that resolves the closest palette color with a single gather"""
+    
+    CELL_BITS = 2  # 64³ cells spanning 4 values per channel
+    AMBIGUOUS = 255
+    
+    def __init__(self, palette_array: np.ndarray, assigner: 'PaletteAssigner', metric: str = "rgb"):
+        if len(palette_array) >= self.AMBIGUOUS:
+            raise ColorProcessingException("Lookup table supports at most 254 palette colors")
+        self.palette_array = palette_array
+        self.assigner = assigner
+        self.metric = metric
+        self.cells = self._build_cells()
+    
+    def _build_cells(self) -> np.ndarray:
+        """Label every grid cell whose corners agree, mark the rest for exact refinement"""
+        cell_size = 1 << self.CELL_BITS
+        cell_count = 256 // cell_size
+        
+        # First and last value of every cell along one axis
+        starts = np.arange(cell_count, dtype=np.uint8) * cell_size
+        axis = np.stack([starts, starts + (cell_size - 1)], axis=1).ravel()
+        corners = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+        
+        corner_labels = self.assigner.assign_labels(corners, self.palette_array, self.metric)
+        corner_labels = corner_labels.reshape(cell_count, 2, cell_count, 2, cell_count, 2)
+        
+        # Nearest-color regions are convex in RGB, so agreeing corners decide the whole cell;
+        # perceptual regions are smooth images of convex sets and 4³ cells are far below their curvature
+        lowest = corner_labels.min(axis=(1, 3, 5))
+        highest = corner_labels.max(axis=(1, 3, 5))
+        cells = np.where(lowest == highest, lowest, self.AMBIGUOUS).astype(np.uint8)
+        return cells.ravel()
+    
+    def lookup(self, pixels: np.ndarray) -> np.ndarray:
+        """Index of the closest palette color for every pixel"""
+        flat_pixels = pixels.reshape(-1, 3)
+        shift = self.CELL_BITS
+        bits = 8 - shift
+        
+        cell_index = (flat_pixels[:, 0].astype(np.int32) >> shift) << (2 * bits)
+        cell_index |= (flat_pixels[:, 1].astype(np.int32) >> shift) << bits
+        cell_index |= flat_pixels[:, 2].astype(np.int32) >> shift
+        labels = self.cells[cell_index]
+        
+        # Exact refinement for pixels in cells straddling a region boundary
+        ambiguous = labels == self.AMBIGUOUS
+        if ambiguous.any():
+            labels[ambiguous] = self.assigner.assign_labels(flat_pixels[ambiguous], self.palette_array, self.metric)
+        
+        return labels.reshape(pixels.shape[:-1])
+
+class PaletteAssigner:
+    """Infrastructure service for memory-bounded nearest-color assignment"""
+    
+    def __init__(self, max_memory_mb: float = 64.0, use_lookup_table: bool = True, max_cached_tables: int = 8):
+        if max_memory_mb <= 0:
+            raise ValueError("Memory budget must be positive")
+        self.max_memory_mb = max_memory_mb
+        self.use_lookup_table = use_lookup_table
+        self.max_cached_tables = max_cached_tables
+        self._tables: 'OrderedDict[bytes, PaletteLookupTable]' = OrderedDict()
+        self._tables_lock = threading.Lock()
+    
+    def chunk_size(self, color_count: int) -> int:
+        """Number of pixels per chunk that keeps working buffers within budget"""
+        # int32 pixel copy, int32 differences and distances per palette color, label
+        bytes_per_pixel = 4 * 3 + color_count * (4 * 3 + 4) + 8
+        return max(1, int(self.max_memory_mb * 1024 * 1024) // bytes_per_pixel)
+    
+    def assign_labels(self, pixels: np.ndarray, palette_array: np.ndarray, metric: str = "rgb") -> np.ndarray:
+        """Index of the closest palette color for every pixel under the given color metric"""
+        to_space = color_space(metric)
+        flat_pixels = pixels.reshape(-1, 3)
+        # Palette side is converted once; pixels per chunk through cached tables
+        palette = to_space(palette_array)
+        labels = np.empty(len(flat_pixels), dtype=np.uint8)
+        
+        step = self.chunk_size(len(palette))
+        for start in range(0, len(flat_pixels), step):
+            chunk = to_space(flat_pixels[start:start + step])
+            diff = chunk[:, None, :] - palette[None, :, :]
+            # RGB squared distances fit comfortably in int32 (max 3 * 255^2)
+            distances = np.einsum('nkc,nkc->nk', diff, diff)
+            labels[start:start + step] = np.argmin(distances, axis=1)
+        
+        return labels.reshape(pixels.shape[:-1])
+    
+    def lookup_table(self, palette_array: np.ndarray, metric: str = "rgb") -> PaletteLookupTable:
+        """Lookup table for a palette and metric, built once and kept in a small LRU cache"""
+        palette_array = np.ascontiguousarray(palette_array, dtype=np.uint8)
+        key = metric.encode() + b':' + palette_array.tobytes()
+        
+        with self._tables_lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+        
+        table = PaletteLookupTable(palette_array, self, metric)
+        with self._tables_lock:
+            self._tables[key] = table
+            while len(self._tables) > self.max_cached_tables:
+                self._tables.popitem(last=False)
+        return table
+    
+    def lookup_labels(self, pixels: np.ndarray, palette_array: np.ndarray, metric: str = "rgb") -> np.ndarray:
+        """Index of the closest palette color for every pixel, via the lookup table when enabled"""
+        if not self.use_lookup_table:
+            return self.assign_labels(pixels, palette_array, metric)
+        return self.lookup_table(palette_array, metric).lookup(pixels)
+    
+    def tile_rows(self, width: int, color_count: int) -> int:
+        """Number of image rows processed per tile"""
+        return max(1, self.chunk_size(color_count) // max(1, width))
+    
+    def iter_label_tiles(self, pixels: np.ndarray, palette_array: np.ndarray, metric: str = "rgb",
+                         dither: str = "none") -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (top row, labels) per tile; only one tile of the source is touched at a time"""
+        if dither != "none":
+            yield from create_ditherer(dither).iter_label_tiles(pixels, palette_array, self, metric)
+            return
+        height, width = pixels.shape[:2]
+        rows = self.tile_rows(width, len(palette_array))
+        for top in range(0, height, rows):
+            yield top, self.lookup_labels(pixels[top:top + rows], palette_array, metric)
+    
+    def label_map(self, pixels: np.ndarray, palette_array: np.ndarray,
+                  progress: Optional[Callable[[float], None]] = None, metric: str = "rgb",
+                  dither: str = "none") -> np.ndarray:
+        """Closest palette index (or dithered index) for every pixel, computed tile by tile"""
+        height, width = pixels.shape[:2]
+        labels = np.empty((height, width), dtype=np.uint8)
+        
+        for top, tile_labels in self.iter_label_tiles(pixels, palette_array, metric, dither):
+            labels[top:top + len(tile_labels)] = tile_labels
+            if progress is not None:
+                progress((top + len(tile_labels)) / height)
+        
+        return labels
+    
+    def apply(self, pixels: np.ndarray, palette_array: np.ndarray, output_colors: np.ndarray,
+              metric: str = "rgb", dither: str = "none") -> np.ndarray:
+        """Replace every pixel with the output color of its closest palette entry, tile by tile"""
+        height, width = pixels.shape[:2]
+        result = np.empty((height, width, output_colors.shape[1]), dtype=output_colors.dtype)
+        
+        for top, tile_labels in self.iter_label_tiles(pixels, palette_array, metric, dither):
+            result[top:top + len(tile_labels)] = output_colors[tile_labels]
+        
+        return result
+
+class PaletteCache:
+    """Content-addressed LRU cache for fitted palettes and label maps, optionally persisted to disk"""
+    
+    def __init__(self, max_memory_mb: float = 256.0, cache_dir: Optional[Path] = None,
+                 max_disk_mb: float = 1024.0):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self._entries: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._memory_bytes = 0
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def fingerprint(self, pixels: np.ndarray) -> str:
+        """Content hash of an image, memoized per array (pixels are treated as immutable)"""
+        with self._lock:
+            memo = self._fingerprints.get(id(pixels))
+            if memo is not None and memo[0]() is pixels:
+                return memo[1]
+        
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{pixels.shape}:{pixels.dtype}".encode())
+        digest.update(np.ascontiguousarray(pixels).data)
+        value = digest.hexdigest()
+        
+        with self._lock:
+            # Drop memo entries for arrays that have been garbage collected
+            self._fingerprints = {
+                key: memo for key, memo in self._fingerprints.items() if memo[0]() is not None
+            }
+            self._fingerprints[id(pixels)] = (weakref.ref(pixels), value)
+        return value
+    
+    @staticmethod
+    def key(*parts) -> str:
+        """Combine key parts into a fixed-length cache key"""
+        return hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=20).hexdigest()
+    
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Cached array for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        
+        value = self._load(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+    
+    def put(self, key: str, value: np.ndarray) -> None:
+        """Store an array in memory and, when configured, on disk"""
+        value = np.ascontiguousarray(value)
+        value.setflags(write=False)
+        self._remember(key, value)
+        self._store(key, value)
+    
+    def clear(self) -> None:
+        """Drop all in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+    
+    def _remember(self, key: str, value: np.ndarray) -> None:
+        """Insert into the memory tier and evict least recently used entries over budget"""
+        if value.nbytes > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous.nbytes
+            self._entries[key] = value
+            self._memory_bytes += value.nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+    
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        """Read an entry from the disk tier"""
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            value = np.load(path, allow_pickle=False)
+            os.utime(path)  # Mark as recently used for eviction
+            return value
+        except (OSError, ValueError):
+            return None
+    
+    def _store(self, key: str, value: np.ndarray) -> None:
+        """Write an entry to the disk tier and evict the oldest files over budget"""
+        if self.cache_dir is None:
+            return
+        try:
+            temp_path = self.cache_dir / f"{key}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as handle:
+                np.save(handle, value, allow_pickle=False)
+            os.replace(temp_path, self._path(key))
+            
+            files = sorted(self.cache_dir.glob("*.npy"), key=lambda path: path.stat().st_mtime)
+            total = sum(path.stat().st_size for path in files)
+            for path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                total -= path.stat().st_size
+                path.unlink(missing_ok=True)
+        except OSError:
+            # Disk persistence is best effort; the memory tier still serves the entry
+            pass
\ No newline at end of file
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+Record = Dict[str, object]
+
+class LoggingSink:
+    """Sends records to a logger, one line per record"""
+    
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("color_reduction")
+        self.level = level
+    
+    def __call__(self, record: Record) -> None:
+        self.logger.log(self.level, " ".join(f"{key}={value}" for key, value in record.items()))
+
+class JsonLinesSink:
+    """Appends records to a JSON lines file; safe to share between threads and processes"""
+    
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+    
+    def __call__(self, record: Record) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            # One append per record, so concurrent writers never interleave within a line
+            with open(self.file_path, 'a', encoding='utf-8') as handle:
+                handle.write(line)
+
+class CallbackSink:
+    """Hands records to a callable, e.g. a thread-safe queue feeding the GUI"""
+    
+    def __init__(self, callback: Callable[[Record], None]):
+        self.callback = callback
+    
+    def __call__(self, record: Record) -> None:
+        self.callback(record)
+
+class Instrumentation:
+    """Per-stage timers, optional peak-allocation tracking and counters, emitted as records"""
+    
+    enabled = True
+    # tracemalloc keeps one process-wide peak; only the thread holding this lock reads and resets it
+    _memory_lock = threading.RLock()
+    
+    def __init__(self, *sinks: Callable[[Record], None], track_memory: bool = False):
+        self.sinks = list(sinks)
+        self.track_memory = track_memory
+        self._local = threading.local()
+        self._started_tracing = False
+    
+    def emit(self, record: Record) -> None:
+        for sink in self.sinks:
+            sink(record)
+    
+    def close(self) -> None:
+        """Stop allocation tracing if this instance started it"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+    
+    def event(self, name: str, **fields) -> None:
+        """Emit a point-in-time record such as a cache hit"""
+        self.emit({'event': name, 'thread': threading.current_thread().name, **fields})
+    
+    @contextmanager
+    def stage(self, name: str, **fields) -> Iterator[Record]:
+        """Time a block; the yielded dict takes extra fields (e.g. iteration counts) before emission
+        
+        With track_memory, one thread at a time measures: a stage entered while another thread holds the
+        measurement reports peak_mb as None rather than a peak the other thread has reset. The lock is never
+        waited for, since a measuring stage may itself wait on pool threads that enter stages.
+        """
+        stack: List[dict] = self._local.__dict__.setdefault('stack', [])
+        frame = {'peak': 0, 'traced': False}
+        if self.track_memory and self._memory_lock.acquire(blocking=False):
+            frame['traced'] = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            frame['start'] = current
+            tracemalloc.reset_peak()
+        stack.append(frame)
+        
+        extra: Record = {}
+        started = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            record = {'event': 'stage', 'stage': name, 'seconds': round(seconds, 6),
+                      'thread': threading.current_thread().name, **fields, **extra}
+            if frame['traced']:
+                # Peaks of nested stages were folded into this frame before they reset the counter
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = round(max(0, peak - frame['start']) / (1024 * 1024), 3)
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+                tracemalloc.reset_peak()
+                self._memory_lock.release()
+            elif self.track_memory:
+                record['peak_mb'] = None
+            self.emit(record)
+
+class _NullStage:
+    """Reusable no-op context manager, avoids building a generator per disabled stage"""
+    
+    def __enter__(self) -> Record:
+        return {}
+    
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+class NullInstrumentation(Instrumentation):
+    """Disabled instrumentation: every hook is a no-op"""
+    
+    enabled = False
+    _STAGE = _NullStage()
+    
+    def __init__(self):
+        super().__init__()
+    
+    def emit(self, record: Record) -> None:
+        pass
+    
+    def event(self, name: str, **fields) -> None:
+        pass
+    
+    def stage(self, name: str, **fields) -> _NullStage:
+        return self._STAGE
+
+NULL_INSTRUMENTATION = NullInstrumentation()
\ No newline at end of file
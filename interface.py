@@ -1,3 +1,6 @@
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
 from pathlib import Path
@@ -5,32 +8,76 @@ from typing import List, Optional
 import numpy as np
 from PIL import Image, ImageTk
 
+# numpy and OpenCV still load here through infrastructure; only scikit-learn is deferred (see quantizers)
 from domain import RGBColor, ColorPalette
-from infrastructure import ImageRepository, ColorAnalyzer
+from infrastructure import ImageRepository, ColorAnalyzer, DisplayCache, ProjectRepository
 from application import ColorReductionService
+from quantizers import QUANTIZERS, KMEANS_PRESETS, preload_backends
+from dithering import DITHER_MODES
+from cleanup import DEFAULT_CLEANUP
+from workers import BackgroundWorker
+from instrumentation import Instrumentation, CallbackSink
+from exporters import LayerExporter, ContourExporter
 
 class ModernColorReductionApp:
     """Modern, professional GUI with clean architecture"""
     
-    def __init__(self, root):
+    RESIZE_DEBOUNCE_MS = 150
+    UNMAPPED_DISPLAY_SIZE = 400  # Box for labels that have not been laid out yet (e.g. the hidden tab)
+    
+    def __init__(self, root, started: Optional[float] = None):
         self.root = root
+        self.started = started
         self.root.title("Color Reduction Pro")
         self.root.geometry("900x650")
         self.root.configure(bg='#f8f9fa')
         
         # Initialize architecture layers
         self.image_repo = ImageRepository()
-        self.color_analyzer = ColorAnalyzer()
+        self.project_repo = ProjectRepository()
+        # Stage timings come back from the worker thread through a queue drained on the main thread
+        self.stage_records: 'queue.Queue' = queue.Queue()
+        self.color_analyzer = ColorAnalyzer(instrumentation=Instrumentation(CallbackSink(self.stage_records.put)))
         self.color_service = ColorReductionService(self.color_analyzer)
+        self.layer_exporter = LayerExporter()
+        self.contour_exporter = ContourExporter()
+        self.display_cache = DisplayCache(self.color_analyzer)
+        self.worker = BackgroundWorker(self.root)
+        self.prefetcher = BackgroundWorker(self.root, name="color-prefetch")
         
         # Application state
         self.current_image = None
         self.processed_image = None
+        self.processed_layers = None
+        self.project = None
         self.selected_colors: List[RGBColor] = []
         self.color_previews = []  # Store preview canvas references
+        self.full_resolution = tk.BooleanVar(value=False)
+        self.quantizer = tk.StringVar(value=self.color_analyzer.quantizer)
+        self.preset = tk.StringVar(value=self.color_analyzer.preset)
+        self.dither = tk.StringVar(value="none")
+        self.sweep = tk.BooleanVar(value=False)
+        self.perceptual = tk.BooleanVar(value=False)
+        self.cleanup = tk.BooleanVar(value=False)
+        self.displayed = {}  # Image type -> pixels currently shown
+        self.display_labels = {"original": [], "processed": []}
+        self.redisplay_job = None
         
         self.setup_styles()
         self.create_interface()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after_idle(self.report_startup)
+        # Import the clustering backend once the window is up, so the first Process doesn't pay for it
+        self.root.after(100, lambda: threading.Thread(
+            target=preload_backends, name="color-prewarm", daemon=True).start())
+    
+    def report_startup(self):
+        """Show and record how long the window took to appear"""
+        if self.started is None:
+            return
+        seconds = time.perf_counter() - self.started
+        self.color_analyzer.instrumentation.event("startup", seconds=round(seconds, 3))
+        self.status.set(f"Ready (started in {seconds:.2f}s)")
     
     def setup_styles(self):
         """Configure modern, professional styling"""
@@ -71,11 +118,21 @@ class ModernColorReductionApp:
         self.setup_manual_tab()
         
         # Status bar
+        status_frame = tk.Frame(self.root, bg='#34495e')
+        status_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+        
         self.status = tk.StringVar(value="Ready")
-        status_bar = tk.Label(self.root, textvariable=self.status,
+        status_bar = tk.Label(status_frame, textvariable=self.status,
                             font=('Segoe UI', 9), bg='#34495e', fg='white',
                             anchor=tk.W, padx=10)
-        status_bar.pack(fill=tk.X, padx=20, pady=(0, 20))
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", command=self.cancel_job)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5, pady=2)
+        self.cancel_button.state(['disabled'])
+        
+        self.progress = ttk.Progressbar(status_frame, length=160, maximum=1.0)
+        self.progress.pack(side=tk.RIGHT, padx=5)
     
     def setup_auto_tab(self):
         """Auto color reduction tab"""
@@ -91,6 +148,17 @@ class ModernColorReductionApp:
                                       width=8, state="readonly")
         self.auto_count.pack(side=tk.LEFT, padx=10)
         self.auto_count.set('6')
+        self.auto_count.bind("<<ComboboxSelected>>", self.on_auto_count_changed)
+        
+        ttk.Label(controls, text="Method:").pack(side=tk.LEFT)
+        ttk.Combobox(controls, textvariable=self.quantizer, values=list(QUANTIZERS),
+                    width=10, state="readonly").pack(side=tk.LEFT, padx=10)
+        ttk.Label(controls, text="Quality:").pack(side=tk.LEFT)
+        ttk.Combobox(controls, textvariable=self.preset, values=list(KMEANS_PRESETS),
+                    width=8, state="readonly").pack(side=tk.LEFT, padx=10)
+        ttk.Label(controls, text="Dither:").pack(side=tk.LEFT)
+        ttk.Combobox(controls, textvariable=self.dither, values=DITHER_MODES,
+                    width=14, state="readonly").pack(side=tk.LEFT, padx=10)
         
         ttk.Button(controls, text="Upload Image", 
                   command=self.upload_image).pack(side=tk.LEFT, padx=5)
@@ -98,6 +166,20 @@ class ModernColorReductionApp:
                   command=self.process_auto, style='Primary.TButton').pack(side=tk.LEFT, padx=5)
         ttk.Button(controls, text="Save", 
                   command=self.save_image).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Export Layers",
+                  command=self.export_layers).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Export Outlines",
+                  command=self.export_outlines).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Save Project",
+                  command=self.save_project).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controls, text="Open Project",
+                  command=self.open_project).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(controls, text="Full resolution",
+                       variable=self.full_resolution).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(controls, text="Sweep all counts",
+                       variable=self.sweep).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(controls, text="Clean up for printing",
+                       variable=self.cleanup).pack(side=tk.LEFT, padx=5)
         
         # Image display
         self.setup_image_display(frame, "auto")
@@ -122,6 +204,18 @@ class ModernColorReductionApp:
         self.manual_count.set('4')
         self.manual_count.bind("<<ComboboxSelected>>", self.update_color_selectors)
         
+        ttk.Label(color_frame, text="Method:").pack(anchor=tk.W)
+        ttk.Combobox(color_frame, textvariable=self.quantizer, values=list(QUANTIZERS),
+                    state="readonly").pack(fill=tk.X, pady=5)
+        
+        ttk.Label(color_frame, text="Quality:").pack(anchor=tk.W)
+        ttk.Combobox(color_frame, textvariable=self.preset, values=list(KMEANS_PRESETS),
+                    state="readonly").pack(fill=tk.X, pady=5)
+        
+        ttk.Label(color_frame, text="Dither:").pack(anchor=tk.W)
+        ttk.Combobox(color_frame, textvariable=self.dither, values=DITHER_MODES,
+                    state="readonly").pack(fill=tk.X, pady=5)
+        
         self.color_selector_frame = ttk.Frame(color_frame)
         self.color_selector_frame.pack(fill=tk.X, pady=5)
         
@@ -137,6 +231,20 @@ class ModernColorReductionApp:
                   command=self.process_manual).pack(fill=tk.X, pady=2)
         ttk.Button(action_frame, text="Save", 
                   command=self.save_image).pack(fill=tk.X, pady=2)
+        ttk.Button(action_frame, text="Export Layers",
+                  command=self.export_layers).pack(fill=tk.X, pady=2)
+        ttk.Button(action_frame, text="Export Outlines",
+                  command=self.export_outlines).pack(fill=tk.X, pady=2)
+        ttk.Button(action_frame, text="Save Project",
+                  command=self.save_project).pack(fill=tk.X, pady=2)
+        ttk.Button(action_frame, text="Open Project",
+                  command=self.open_project).pack(fill=tk.X, pady=2)
+        ttk.Checkbutton(action_frame, text="Full resolution",
+                       variable=self.full_resolution).pack(anchor=tk.W, pady=2)
+        ttk.Checkbutton(action_frame, text="Perceptual matching (OKLab)",
+                       variable=self.perceptual).pack(anchor=tk.W, pady=2)
+        ttk.Checkbutton(action_frame, text="Clean up for printing",
+                       variable=self.cleanup).pack(anchor=tk.W, pady=2)
         
         # Color previews
         preview_frame = ttk.LabelFrame(left_panel, text="Color Preview", padding=10)
@@ -187,12 +295,90 @@ class ModernColorReductionApp:
         else:
             self.manual_original = orig_label
             self.manual_processed = proc_label
+        self.display_labels["original"].append(orig_label)
+        self.display_labels["processed"].append(proc_label)
+        for label in (orig_label, proc_label):
+            label.bind("<Configure>", self.schedule_redisplay)
     
     def update_status(self, message: str):
         """Update status bar"""
         self.status.set(message)
         self.root.update_idletasks()
     
+    def run_in_background(self, message: str, task, on_success, failure_status: str, on_partial=None):
+        """Run a service call on the worker thread, keeping the window responsive"""
+        self.update_status(message)
+        self.progress['value'] = 0
+        self.cancel_button.state(['!disabled'])
+        
+        self.stage_timings()  # Drop records of earlier jobs
+        
+        def succeed(result):
+            self.finish_job()
+            on_success(result)
+            timings = self.stage_timings()
+            if timings:
+                self.status.set(f"{self.status.get()} — {timings}")
+        
+        def fail(error: Exception):
+            self.finish_job()
+            messagebox.showerror("Error", str(error))
+            self.update_status(failure_status)
+        
+        self.worker.submit(task, succeed, fail, self.show_progress, on_partial)
+    
+    def stage_timings(self) -> str:
+        """Summarize the stage records of the finished job, slowest stages first"""
+        totals = {}
+        while True:
+            try:
+                record = self.stage_records.get_nowait()
+            except queue.Empty:
+                break
+            if record['event'] == 'stage' and record['thread'].startswith(self.worker.name):
+                totals[record['stage']] = totals.get(record['stage'], 0.0) + record['seconds']
+        
+        overall = totals.pop('auto_reduce_colors', None) or totals.pop('manual_reduce_colors', None)
+        if overall is None:
+            return ""
+        slowest = sorted(totals.items(), key=lambda item: -item[1])[:3]
+        return f"{overall:.2f}s (" + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in slowest) + ")"
+    
+    def show_preview(self, pixels: np.ndarray):
+        """Show the thumbnail-resolution result while the full result is computed"""
+        self.display_image(pixels, "processed")
+        self.status.set("Preview ready, refining...")
+    
+    def show_progress(self, stage: str, fraction: float):
+        """Reflect worker progress in the status bar"""
+        self.progress['value'] = fraction
+        self.status.set(f"{stage}... {fraction:.0%}")
+    
+    def finish_job(self):
+        """Reset progress widgets after a job ends"""
+        self.progress['value'] = 0
+        self.cancel_button.state(['disabled'])
+    
+    def cancel_job(self):
+        """Cancel the running job"""
+        if self.worker.busy:
+            self.worker.cancel()
+            self.finish_job()
+            self.update_status("Cancelled")
+    
+    def discard_running_job(self, event=None):
+        """Settings changed mid-run: the running job's result would be stale"""
+        if self.worker.busy:
+            self.worker.cancel()
+            self.finish_job()
+            self.update_status("Settings changed, previous job discarded")
+    
+    def close(self):
+        """Stop background work and close the window"""
+        self.worker.shutdown()
+        self.prefetcher.shutdown()
+        self.root.destroy()
+    
     def upload_image(self):
         """Load image with error handling"""
         try:
@@ -202,11 +388,10 @@ class ModernColorReductionApp:
                 return
             
             self.update_status("Loading image...")
+            self.prefetcher.cancel()
             self.current_image = self.image_repo.load(Path(path))
             
-            # Display thumbnail
-            thumbnail = self.color_analyzer.create_thumbnail(self.current_image.pixels)
-            self.display_image(thumbnail, "original")
+            self.display_image(self.current_image.pixels, "original")
             
             self.update_status(f"Loaded: {self.current_image.file_path.name}")
             
@@ -214,25 +399,52 @@ class ModernColorReductionApp:
             messagebox.showerror("Error", str(e))
             self.update_status("Load failed")
     
+    def on_auto_count_changed(self, event=None):
+        """Color count changed: drop stale work and, in sweep mode, redisplay from the cached sweep"""
+        self.discard_running_job()
+        if self.sweep.get() and self.current_image is not None and self.processed_image is not None:
+            self.process_auto()
+    
     def process_auto(self):
         """Auto color reduction"""
         if not self.current_image:
             messagebox.showwarning("Warning", "Please upload an image first")
             return
         
-        try:
-            self.update_status("Processing...")
-            count = int(self.auto_count.get())
-            
-            result = self.color_service.auto_reduce_colors(self.current_image, count)
+        image = self.current_image
+        count = int(self.auto_count.get())
+        full_resolution = self.full_resolution.get()
+        quantizer = self.quantizer.get()
+        preset = self.preset.get()
+        dither = self.dither.get()
+        sweep = self.sweep.get()
+        cleanup = DEFAULT_CLEANUP if self.cleanup.get() else None
+        
+        def reduce(job):
+            result = self.color_service.auto_reduce_colors(
+                image, count, full_resolution=full_resolution, quantizer=quantizer,
+                progress=job.report, sweep=sweep, preview=job.publish, preset=preset, dither=dither,
+                cleanup=cleanup)
+            # Served from the cached palette and label map of the reduction above
+            project = self.color_service.create_project(
+                image, count, full_resolution=full_resolution, quantizer=quantizer, sweep=sweep, preset=preset,
+                dither=dither, cleanup=cleanup)
+            return result, project, self.color_service.project_label_map(project)
+        
+        def show_result(outcome):
+            result, self.project, self.processed_layers = outcome
             self.processed_image = result
-            
             self.display_image(result, "processed")
             self.update_status(f"Reduced to {count} colors")
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.update_status("Processing failed")
+            if sweep:
+                # Prepare the other color counts while the user looks at this one
+                self.prefetcher.submit(
+                    lambda job: self.color_service.warm_sweep_labels(
+                        image, quantizer=quantizer, full_resolution=full_resolution, progress=job.report,
+                        preset=preset, dither=dither, cleanup=cleanup),
+                    lambda result: None)
+        
+        self.run_in_background("Processing...", reduce, show_result, "Processing failed", self.show_preview)
     
     def analyze_colors(self):
         """Analyze dominant colors"""
@@ -240,18 +452,20 @@ class ModernColorReductionApp:
             messagebox.showwarning("Warning", "Please upload an image first")
             return
         
-        try:
-            self.update_status("Analyzing colors...")
-            count = int(self.manual_count.get())
-            
-            palette = self.color_service.analyze_image_colors(self.current_image, count)
+        image = self.current_image
+        count = int(self.manual_count.get())
+        quantizer = self.quantizer.get()
+        preset = self.preset.get()
+        
+        def show_palette(palette):
             self.display_palette(palette, self.dominant_canvas)
-            
             self.update_status(f"Found {count} color regions")
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.update_status("Analysis failed")
+        
+        self.run_in_background(
+            "Analyzing colors...",
+            lambda job: self.color_service.analyze_image_colors(image, count, quantizer, progress=job.report,
+                                                                preset=preset),
+            show_palette, "Analysis failed")
     
     def process_manual(self):
         """Process with selected filament colors"""
@@ -264,41 +478,78 @@ class ModernColorReductionApp:
             messagebox.showwarning("Warning", "Please select filament colors first")
             return
         
-        try:
-            self.update_status("Processing with filament colors...")
-            palette = ColorPalette(tuple(valid_colors))
-            
-            result = self.color_service.manual_reduce_colors(self.current_image, palette)
+        image = self.current_image
+        palette = ColorPalette(tuple(valid_colors))
+        full_resolution = self.full_resolution.get()
+        quantizer = self.quantizer.get()
+        preset = self.preset.get()
+        dither = self.dither.get()
+        metric = "oklab" if self.perceptual.get() else "rgb"
+        cleanup = DEFAULT_CLEANUP if self.cleanup.get() else None
+        
+        def reduce(job):
+            result = self.color_service.manual_reduce_colors(
+                image, palette, full_resolution=full_resolution, quantizer=quantizer,
+                progress=job.report, preview=job.publish, metric=metric, preset=preset, dither=dither,
+                cleanup=cleanup)
+            project = self.color_service.create_project(
+                image, filament_colors=palette, full_resolution=full_resolution, quantizer=quantizer,
+                metric=metric, preset=preset, dither=dither, cleanup=cleanup)
+            return result, project, self.color_service.project_label_map(project)
+        
+        def show_result(outcome):
+            result, self.project, self.processed_layers = outcome
             self.processed_image = result
-            
             self.display_image(result, "processed")
             self.update_status("3D print simulation complete")
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.update_status("Processing failed")
+        
+        self.run_in_background("Processing with filament colors...", reduce, show_result,
+                               "Processing failed", self.show_preview)
     
     def display_image(self, pixels: np.ndarray, image_type: str):
-        """Display image in GUI"""
+        """Display image in both tabs, each rendered to its label's size"""
         try:
-            thumbnail = self.color_analyzer.create_thumbnail(pixels)
-            pil_image = Image.fromarray(thumbnail)
-            photo = ImageTk.PhotoImage(pil_image)
-            
-            if image_type == "original":
-                self.auto_original.config(image=photo, text="")
-                self.auto_original.image = photo
-                self.manual_original.config(image=photo, text="")
-                self.manual_original.image = photo
-            else:
-                self.auto_processed.config(image=photo, text="")
-                self.auto_processed.image = photo
-                self.manual_processed.config(image=photo, text="")
-                self.manual_processed.image = photo
-                
+            self.displayed[image_type] = pixels
+            for label in self.display_labels[image_type]:
+                self.render_label(label, pixels)
         except Exception as e:
             messagebox.showerror("Error", f"Display error: {str(e)}")
     
+    def render_label(self, label: tk.Label, pixels: np.ndarray):
+        """Fit pixels into the label, repainting its PhotoImage in place when the size is unchanged"""
+        inset = 2 * (int(label.cget('bd')) + int(label.cget('highlightthickness')) + int(label.cget('padx')))
+        box_width, box_height = label.winfo_width() - inset, label.winfo_height() - inset
+        if box_width <= 1 or box_height <= 1:
+            box_width = box_height = self.UNMAPPED_DISPLAY_SIZE
+        
+        size = DisplayCache.fit(*pixels.shape[:2], box_width, box_height)
+        if getattr(label, 'rendered', None) == (id(pixels), size):
+            return
+        
+        pil_image = Image.fromarray(self.display_cache.render(pixels, box_width, box_height))
+        photo = getattr(label, 'image', None)
+        if photo is not None and (photo.width(), photo.height()) == pil_image.size:
+            photo.paste(pil_image)
+        else:
+            photo = ImageTk.PhotoImage(pil_image)
+            # A 1x1 requested size lets the layout, not the image, decide the label size (no resize feedback)
+            label.config(image=photo, text="", width=1, height=1)
+            label.image = photo
+        label.rendered = (id(pixels), size)
+    
+    def schedule_redisplay(self, event=None):
+        """Re-render once the window has stopped resizing"""
+        if self.redisplay_job is not None:
+            self.root.after_cancel(self.redisplay_job)
+        self.redisplay_job = self.root.after(self.RESIZE_DEBOUNCE_MS, self.redisplay)
+    
+    def redisplay(self):
+        """Render the shown images to the current label sizes"""
+        self.redisplay_job = None
+        for image_type, pixels in self.displayed.items():
+            for label in self.display_labels[image_type]:
+                self.render_label(label, pixels)
+    
     def display_palette(self, palette: ColorPalette, canvas: tk.Canvas):
         """Display color palette"""
         canvas.delete("all")
@@ -317,6 +568,8 @@ class ModernColorReductionApp:
     
     def update_color_selectors(self, event=None):
         """Update color selection UI"""
+        self.discard_running_job()
+        
         # Clear existing widgets
         for widget in self.color_selector_frame.winfo_children():
             widget.destroy()
@@ -378,10 +631,104 @@ class ModernColorReductionApp:
             if not path:
                 return
             
-            self.image_repo.save(self.processed_image, Path(path))
+            if Path(path).suffix.lower() == '.png' and self.processed_layers is not None:
+                # At most a dozen colors: an 8-bit palettized PNG written straight from the label map
+                self.image_repo.save_indexed(self.processed_layers, Path(path))
+            else:
+                self.image_repo.save(self.processed_image, Path(path))
             messagebox.showinfo("Success", f"Image saved:\n{path}")
             self.update_status("Image saved")
             
         except Exception as e:
             messagebox.showerror("Error", str(e))
-            self.update_status("Save failed")
\ No newline at end of file
+            self.update_status("Save failed")
+    
+    def export_layers(self):
+        """Export one 1-bit mask per filament color of the processed image"""
+        if self.processed_layers is None:
+            messagebox.showwarning("Warning", "No processed image to export")
+            return
+        
+        directory = filedialog.askdirectory(title="Export layer masks to")
+        if not directory:
+            return
+        
+        layers = self.processed_layers
+        stem = self.project.source_path.stem
+        
+        def exported(paths):
+            messagebox.showinfo("Success", f"Exported {len(paths)} layer masks:\n{directory}")
+            self.update_status("Layers exported")
+        
+        self.run_in_background(
+            "Exporting layers...",
+            lambda job: self.layer_exporter.export_masks(
+                layers, Path(directory), stem, progress=lambda fraction: job.report("Exporting layers", fraction)),
+            exported, "Export failed")
+    
+    def export_outlines(self):
+        """Export per-color polygon outlines of the processed image for slicers"""
+        if self.processed_layers is None:
+            messagebox.showwarning("Warning", "No processed image to export")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            defaultextension=".svg",
+            filetypes=[("SVG", "*.svg"), ("DXF", "*.dxf")])
+        if not path:
+            return
+        
+        layers = self.processed_layers
+        
+        def exported(file_path):
+            messagebox.showinfo("Success", f"Outlines saved:\n{file_path}")
+            self.update_status("Outlines exported")
+        
+        self.run_in_background(
+            "Tracing outlines...",
+            lambda job: self.contour_exporter.export(
+                layers, Path(path), progress=lambda fraction: job.report("Tracing outlines", fraction)),
+            exported, "Export failed")
+    
+    def save_project(self):
+        """Save the processed result as a project file that reopens without the source image"""
+        if self.project is None:
+            messagebox.showwarning("Warning", "No processed image to save")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            defaultextension=".npz",
+            filetypes=[("Color Reduction project", "*.npz")])
+        if not path:
+            return
+        
+        project = self.project
+        
+        def saved(result):
+            messagebox.showinfo("Success", f"Project saved:\n{path}")
+            self.update_status("Project saved")
+        
+        self.run_in_background("Saving project...", lambda job: self.project_repo.save(project, Path(path)),
+                               saved, "Project save failed")
+    
+    def open_project(self):
+        """Reopen a saved project: result, layers and settings, without reloading or refitting the source"""
+        path = filedialog.askopenfilename(filetypes=[("Color Reduction project", "*.npz")])
+        if not path:
+            return
+        
+        def load(job):
+            project = self.project_repo.load(Path(path))
+            return project, self.color_service.render_project(project), self.color_service.project_label_map(project)
+        
+        def opened(outcome):
+            self.project, self.processed_image, self.processed_layers = outcome
+            settings = self.project.settings
+            for variable, name in ((self.quantizer, 'quantizer'), (self.preset, 'preset'), (self.dither, 'dither')):
+                if name in settings:
+                    variable.set(settings[name])
+            self.perceptual.set(settings.get('metric', "rgb") != "rgb")
+            self.display_image(self.processed_image, "processed")
+            self.update_status(f"Opened project: {self.project.source_path.name}")
+        
+        self.run_in_background("Opening project...", load, opened, "Project open failed")
\ No newline at end of file
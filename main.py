@@ -1,10 +1,24 @@
+import time
+# Taken before the other imports so the startup metric includes them
+STARTED = time.perf_counter()
+
+import sys
 import tkinter as tk
-from interface import ModernColorReductionApp
 
 def main():
     """Clean, professional application entry point"""
+    if sys.argv[1:2] == ["serve"]:
+        from server import main as server_main
+        sys.exit(server_main(sys.argv[2:]))
+    
+    # Any other command-line arguments select the headless batch mode
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
+    from interface import ModernColorReductionApp
     root = tk.Tk()
-    app = ModernColorReductionApp(root)
+    app = ModernColorReductionApp(root, started=STARTED)
     root.mainloop()
 
 if __name__ == "__main__":
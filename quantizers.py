@@ -0,0 +1,466 @@
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Tuple, Type
+import numpy as np
+from domain import ColorProcessingException
+
+def _sklearn_cluster():
+    """scikit-learn takes seconds to import, so it is loaded when a K-means backend first runs"""
+    from sklearn import cluster
+    return cluster
+
+@lru_cache(maxsize=None)
+def _thread_controller():
+    """Native thread pools, inspected once: a fresh inspection per fit costs about 10 ms"""
+    from threadpoolctl import ThreadpoolController
+    return ThreadpoolController()
+
+def preload_backends() -> None:
+    """Import scikit-learn ahead of time, e.g. from a background thread; numpy and OpenCV are already loaded"""
+    _sklearn_cluster()
+
+@dataclass(frozen=True)
+class KMeansPreset:
+    """Speed/quality trade-off of the K-means restart strategy"""
+    
+    restarts: int  # Upper bound on independent restarts
+    round_size: int  # Restarts fitted concurrently; fixed so results do not depend on the core count
+    patience: Optional[int]  # Rounds without improvement before stopping; None runs every restart
+    min_improvement: float  # Relative inertia gain a round needs to count as an improvement
+    seed_sample: Optional[int]  # Histogram colors k-means++ seeds from; None uses all of them
+    max_iter: int
+    tol: float
+
+KMEANS_PRESETS: Dict[str, KMeansPreset] = {
+    "fast": KMeansPreset(restarts=2, round_size=2, patience=1, min_improvement=1e-3, seed_sample=1024,
+                         max_iter=100, tol=1e-3),
+    "balanced": KMeansPreset(restarts=6, round_size=2, patience=1, min_improvement=1e-3, seed_sample=4096,
+                             max_iter=300, tol=1e-4),
+    "best": KMeansPreset(restarts=10, round_size=2, patience=None, min_improvement=0.0, seed_sample=None,
+                         max_iter=300, tol=1e-4),
+}
+DEFAULT_PRESET = "best"
+
+def kmeans_preset(name: str) -> KMeansPreset:
+    """Look up a K-means preset by name"""
+    try:
+        return KMEANS_PRESETS[name]
+    except KeyError:
+        raise ColorProcessingException(
+            f"Unknown preset '{name}'. Available: {', '.join(KMEANS_PRESETS)}"
+        ) from None
+
+class Quantizer(ABC):
+    """Base class for color quantization backends working on a weighted color histogram"""
+    
+    name = "base"
+    iterations = None  # Iterations of the last fit, for backends that iterate
+    
+    @abstractmethod
+    def fit(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> np.ndarray:
+        """Return up to color_count RGB centers for colors weighted by counts"""
+    
+    def fit_sweep(self, colors: np.ndarray, counts: np.ndarray, max_colors: int) -> Dict[int, np.ndarray]:
+        """Centers for every palette size from 1 to max_colors"""
+        return {color_count: self.fit(colors, counts, color_count) for color_count in range(1, max_colors + 1)}
+    
+    def _warm_start_sweep(self, colors: np.ndarray, counts: np.ndarray, max_colors: int,
+                          make_estimator: Callable[[int, np.ndarray], object]) -> Dict[int, np.ndarray]:
+        """Grow the palette one center at a time, refining k + 1 centers from the k solution"""
+        centers = np.average(colors, axis=0, weights=counts)[None, :]
+        sweep = {1: centers}
+        self.iterations = 0
+        
+        for color_count in range(2, max_colors + 1):
+            # Seed the new center at the color contributing most to the remaining error
+            distances = np.min(np.sum((colors[:, None, :] - centers[None, :, :]) ** 2, axis=2), axis=1)
+            seed = colors[np.argmax(distances * counts)]
+            estimator = make_estimator(color_count, np.vstack([centers, seed]))
+            estimator.fit(colors, sample_weight=counts)
+            centers = estimator.cluster_centers_
+            sweep[color_count] = centers
+            self.iterations += estimator.n_iter_
+        
+        return sweep
+    
+    @staticmethod
+    def _weighted_means(colors: np.ndarray, counts: np.ndarray, groups: np.ndarray, group_count: int) -> np.ndarray:
+        """Weighted mean color of every group"""
+        totals = np.bincount(groups, weights=counts, minlength=group_count)
+        sums = np.stack([
+            np.bincount(groups, weights=colors[:, channel] * counts, minlength=group_count)
+            for channel in range(3)
+        ], axis=1)
+        return sums[totals > 0] / totals[totals > 0, None]
+
+class KMeansQuantizer(Quantizer):
+    """Full K-means with parallel, early-stopping restarts: slowest, highest quality"""
+    
+    name = "kmeans"
+    
+    def __init__(self, preset: str = DEFAULT_PRESET, random_state: int = 42, max_workers: Optional[int] = None):
+        self.preset = kmeans_preset(preset)
+        self.random_state = random_state
+        self.max_workers = max_workers or min(self.preset.round_size, os.cpu_count() or 1)
+        self.restarts = None  # Restarts actually run by the last fit
+    
+    def fit(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> np.ndarray:
+        cluster = _sklearn_cluster()
+        preset = self.preset
+        best_centers, best_inertia = None, np.inf
+        stale_rounds = 0
+        self.iterations = self.restarts = 0
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for first in range(0, preset.restarts, preset.round_size):
+                restarts = range(first, min(first + preset.round_size, preset.restarts))
+                fits = list(pool.map(lambda restart: self._restart(cluster, colors, counts, color_count, restart),
+                                     restarts))
+                
+                # Compared in restart order, so ties resolve the same way on any machine
+                round_best = best_inertia
+                for centers, inertia, iterations in fits:
+                    self.iterations += iterations
+                    if inertia < round_best:
+                        best_centers, round_best = centers, inertia
+                improved = round_best < best_inertia * (1 - preset.min_improvement)
+                best_inertia = round_best
+                self.restarts += len(fits)
+                
+                stale_rounds = 0 if improved else stale_rounds + 1
+                if preset.patience is not None and stale_rounds >= preset.patience:
+                    break
+        
+        return best_centers
+    
+    def _restart(self, cluster, colors: np.ndarray, counts: np.ndarray, color_count: int,
+                 restart: int) -> Tuple[np.ndarray, float, int]:
+        """One Lloyd run from k-means++ seeds drawn on a subsample; seeded by the restart index alone"""
+        seed = self.random_state + restart
+        rng = np.random.default_rng(seed)
+        
+        sample_colors, sample_counts = colors, counts
+        if self.preset.seed_sample is not None and len(colors) > self.preset.seed_sample:
+            index = np.sort(rng.choice(len(colors), self.preset.seed_sample, replace=False))
+            sample_colors, sample_counts = colors[index], counts[index]
+        init, _ = cluster.kmeans_plusplus(sample_colors, color_count, sample_weight=sample_counts,
+                                          random_state=seed)
+        
+        # Restarts already share the cores; nested OpenMP teams would oversubscribe them
+        inner_threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+        limits = (_thread_controller().limit(limits=inner_threads, user_api='openmp')
+                  if self.max_workers > 1 else nullcontext())
+        with limits:
+            kmeans = cluster.KMeans(n_clusters=color_count, init=init, n_init=1, max_iter=self.preset.max_iter,
+                                    tol=self.preset.tol, random_state=seed)
+            kmeans.fit(colors, sample_weight=counts)
+        return kmeans.cluster_centers_, float(kmeans.inertia_), int(kmeans.n_iter_)
+    
+    def fit_sweep(self, colors: np.ndarray, counts: np.ndarray, max_colors: int) -> Dict[int, np.ndarray]:
+        cluster = _sklearn_cluster()
+        return self._warm_start_sweep(colors, counts, max_colors, lambda color_count, init: cluster.KMeans(
+            n_clusters=color_count, init=init, n_init=1, max_iter=self.preset.max_iter, tol=self.preset.tol,
+            random_state=self.random_state))
+
+class MiniBatchKMeansQuantizer(Quantizer):
+    """Mini-batch K-means: close to K-means quality at a fraction of the cost"""
+    
+    name = "minibatch"
+    
+    def __init__(self, batch_size: int = 4096, n_init: int = 3, random_state: int = 42):
+        self.batch_size = batch_size
+        self.n_init = n_init
+        self.random_state = random_state
+    
+    def fit(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> np.ndarray:
+        cluster = _sklearn_cluster()
+        kmeans = cluster.MiniBatchKMeans(n_clusters=color_count, batch_size=self.batch_size,
+                                         n_init=self.n_init, random_state=self.random_state)
+        kmeans.fit(colors, sample_weight=counts)
+        self.iterations = kmeans.n_iter_
+        return kmeans.cluster_centers_
+    
+    def fit_sweep(self, colors: np.ndarray, counts: np.ndarray, max_colors: int) -> Dict[int, np.ndarray]:
+        cluster = _sklearn_cluster()
+        return self._warm_start_sweep(colors, counts, max_colors, lambda color_count, init: cluster.MiniBatchKMeans(
+            n_clusters=color_count, init=init, n_init=1, batch_size=self.batch_size,
+            random_state=self.random_state))
+
+class HierarchicalQuantizer(Quantizer):
+    """Quantizer that reaches k colors by splitting, so every smaller palette comes for free"""
+    
+    @abstractmethod
+    def _splits(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> Iterator[np.ndarray]:
+        """Yield the centers after every split, up to color_count boxes"""
+    
+    def fit(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> np.ndarray:
+        centers = None
+        for centers in self._splits(colors, counts, color_count):
+            pass
+        return centers
+    
+    def fit_sweep(self, colors: np.ndarray, counts: np.ndarray, max_colors: int) -> Dict[int, np.ndarray]:
+        sweep = {}
+        centers = None
+        for color_count, centers in enumerate(self._splits(colors, counts, max_colors), start=1):
+            sweep[color_count] = centers
+        
+        # Splitting stopped early: larger palettes keep the final boxes
+        for color_count in range(len(sweep) + 1, max_colors + 1):
+            sweep[color_count] = centers
+        return sweep
+
+class MedianCutQuantizer(HierarchicalQuantizer):
+    """Median cut: repeatedly split the box with the largest error at its weighted median"""
+    
+    name = "median-cut"
+    
+    def _splits(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> Iterator[np.ndarray]:
+        boxes = [np.arange(len(colors))]
+        errors = [self._box_error(colors, counts, boxes[0])]
+        yield self._box_means(colors, counts, boxes)
+        
+        while len(boxes) < color_count:
+            index = int(np.argmax(errors))
+            if errors[index] <= 0:
+                break
+            
+            box = boxes.pop(index)
+            errors.pop(index)
+            
+            # Split along the widest channel at the weighted median
+            box_colors = colors[box]
+            axis = int(np.argmax(np.ptp(box_colors, axis=0)))
+            ordered = box[np.argsort(box_colors[:, axis], kind='stable')]
+            cumulative = np.cumsum(counts[ordered])
+            split = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+            split = min(max(split, 1), len(ordered) - 1)
+            
+            for half in (ordered[:split], ordered[split:]):
+                boxes.append(half)
+                errors.append(self._box_error(colors, counts, half))
+            yield self._box_means(colors, counts, boxes)
+    
+    def _box_means(self, colors: np.ndarray, counts: np.ndarray, boxes) -> np.ndarray:
+        """Weighted mean color of every box"""
+        groups = np.empty(len(colors), dtype=np.intp)
+        for index, box in enumerate(boxes):
+            groups[box] = index
+        return self._weighted_means(colors, counts, groups, len(boxes))
+    
+    @staticmethod
+    def _box_error(colors: np.ndarray, counts: np.ndarray, box: np.ndarray) -> float:
+        """Weighted squared error of a box around its mean"""
+        if len(box) < 2:
+            return 0.0
+        box_colors = colors[box]
+        weights = counts[box]
+        mean = np.average(box_colors, axis=0, weights=weights)
+        return float(np.sum(weights * np.sum((box_colors - mean) ** 2, axis=1)))
+
+class OctreeQuantizer(Quantizer):
+    """Octree reduction: fold the least populated nodes of the deepest level into their parents"""
+    
+    name = "octree"
+    
+    def fit(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> np.ndarray:
+        rgb = np.clip(np.rint(colors), 0, 255).astype(np.int32)
+        
+        # Deepest level whose node count still fits the requested palette size
+        parent_level = 0
+        child_codes, child_leaves = self._level_nodes(rgb, 1)
+        while parent_level < 7 and len(child_codes) <= color_count:
+            parent_level += 1
+            child_codes, child_leaves = self._level_nodes(rgb, parent_level + 1)
+        
+        if len(child_codes) <= color_count:
+            return self._weighted_means(colors, counts, child_leaves, len(child_codes))
+        
+        # Each child node's parent is its code without the lowest bit per channel
+        parent_of_child = self._parent_codes(child_codes, parent_level + 1)
+        parent_codes, parent_index = np.unique(parent_of_child, return_inverse=True)
+        parent_index = parent_index.ravel()
+        children_per_parent = np.bincount(parent_index, minlength=len(parent_codes))
+        pixels_per_parent = np.bincount(parent_index[child_leaves], weights=counts, minlength=len(parent_codes))
+        
+        # Fold least populated parents first until the leaf count fits
+        excess = len(child_codes) - color_count
+        candidates = np.flatnonzero(children_per_parent > 1)
+        candidates = candidates[np.argsort(pixels_per_parent[candidates], kind='stable')]
+        reductions = np.cumsum(children_per_parent[candidates] - 1)
+        fold_count = int(np.searchsorted(reductions, excess)) + 1
+        folded = np.zeros(len(parent_codes), dtype=bool)
+        folded[candidates[:fold_count - 1]] = True
+        
+        # Folded parents become one leaf, other children stay leaves of their own
+        child_leaf_ids = np.where(folded[parent_index], len(child_codes) + parent_index, np.arange(len(child_codes)))
+        
+        # The last parent only merges as many of its smallest children as still needed
+        remaining = excess - (int(reductions[fold_count - 2]) if fold_count > 1 else 0)
+        last_parent = candidates[fold_count - 1]
+        siblings = np.flatnonzero(parent_index == last_parent)
+        pixels_per_child = np.bincount(child_leaves, weights=counts, minlength=len(child_codes))
+        smallest = siblings[np.argsort(pixels_per_child[siblings], kind='stable')][:remaining + 1]
+        child_leaf_ids[smallest] = len(child_codes) + last_parent
+        
+        _, leaf_ids = np.unique(child_leaf_ids, return_inverse=True)
+        leaf_ids = leaf_ids.ravel()
+        groups = leaf_ids[child_leaves]
+        return self._weighted_means(colors, counts, groups, int(leaf_ids.max()) + 1)
+    
+    @staticmethod
+    def _level_nodes(rgb: np.ndarray, level: int):
+        """Distinct node codes at a tree level and the node of every color"""
+        shift = 8 - level
+        codes = ((rgb[:, 0] >> shift) << (2 * level)) | ((rgb[:, 1] >> shift) << level) | (rgb[:, 2] >> shift)
+        node_codes, nodes = np.unique(codes, return_inverse=True)
+        return node_codes, nodes.ravel()
+    
+    @staticmethod
+    def _parent_codes(codes: np.ndarray, level: int) -> np.ndarray:
+        """Codes of the parent nodes one level up"""
+        mask = (1 << level) - 1
+        r = (codes >> (2 * level)) & mask
+        g = (codes >> level) & mask
+        b = codes & mask
+        parent = level - 1
+        return ((r >> 1) << (2 * parent)) | ((g >> 1) << parent) | (b >> 1)
+
+class WuQuantizer(HierarchicalQuantizer):
+    """Wu's variance-minimization quantizer on a 32³ moment histogram"""
+    
+    name = "wu"
+    
+    SIDE = 33  # 32 bins per channel plus a zero border for the cumulative moments
+    
+    def _splits(self, colors: np.ndarray, counts: np.ndarray, color_count: int) -> Iterator[np.ndarray]:
+        moments = self._cumulative_moments(colors, counts)
+        boxes = [(0, self.SIDE - 1, 0, self.SIDE - 1, 0, self.SIDE - 1)]
+        variances = [self._variance(moments, boxes[0])]
+        yield self._box_means(moments, boxes)
+        
+        while len(boxes) < color_count:
+            index = int(np.argmax(variances))
+            if variances[index] <= 0:
+                break
+            
+            halves = self._cut(moments, boxes[index])
+            if halves is None:
+                variances[index] = 0.0
+                continue
+            
+            boxes[index] = halves[0]
+            variances[index] = self._variance(moments, halves[0])
+            boxes.append(halves[1])
+            variances.append(self._variance(moments, halves[1]))
+            yield self._box_means(moments, boxes)
+    
+    def _box_means(self, moments, boxes) -> np.ndarray:
+        """Mean color of every non-empty box"""
+        weight, red, green, blue, _ = moments
+        centers = []
+        for box in boxes:
+            total = self._volume(weight, *box)
+            if total > 0:
+                centers.append([
+                    self._volume(red, *box) / total,
+                    self._volume(green, *box) / total,
+                    self._volume(blue, *box) / total,
+                ])
+        return np.array(centers)
+    
+    def _cumulative_moments(self, colors: np.ndarray, counts: np.ndarray):
+        """Cumulative weight, channel sums and squared magnitude over the 33³ grid"""
+        bins = (np.clip(colors, 0, 255).astype(np.int32) >> 3) + 1
+        flat = np.ravel_multi_index((bins[:, 0], bins[:, 1], bins[:, 2]), (self.SIDE,) * 3)
+        size = self.SIDE ** 3
+        
+        tables = [
+            np.bincount(flat, weights=counts, minlength=size),
+            np.bincount(flat, weights=counts * colors[:, 0], minlength=size),
+            np.bincount(flat, weights=counts * colors[:, 1], minlength=size),
+            np.bincount(flat, weights=counts * colors[:, 2], minlength=size),
+            np.bincount(flat, weights=counts * np.sum(colors ** 2, axis=1), minlength=size),
+        ]
+        
+        cumulative = []
+        for table in tables:
+            table = table.reshape((self.SIDE,) * 3)
+            cumulative.append(table.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2))
+        return cumulative
+    
+    @staticmethod
+    def _volume(moment: np.ndarray, r0, r1, g0, g1, b0, b1):
+        """Sum of a moment over the box (r0, r1] x (g0, g1] x (b0, b1]; bounds may be arrays"""
+        return (moment[r1, g1, b1] - moment[r1, g1, b0] - moment[r1, g0, b1] + moment[r1, g0, b0]
+                - moment[r0, g1, b1] + moment[r0, g1, b0] + moment[r0, g0, b1] - moment[r0, g0, b0])
+    
+    def _variance(self, moments, box) -> float:
+        """Weighted squared error of a box around its mean"""
+        weight, red, green, blue, squares = moments
+        total = self._volume(weight, *box)
+        if total <= 0:
+            return 0.0
+        r, g, b = (self._volume(moment, *box) for moment in (red, green, blue))
+        return float(self._volume(squares, *box) - (r * r + g * g + b * b) / total)
+    
+    def _cut(self, moments, box):
+        """Split a box at the plane that maximizes the between-halves variance"""
+        weight, red, green, blue, _ = moments
+        whole = [self._volume(moment, *box) for moment in (weight, red, green, blue)]
+        
+        best_score, best_axis, best_position = 0.0, None, None
+        for axis in range(3):
+            low, high = box[2 * axis], box[2 * axis + 1]
+            positions = np.arange(low + 1, high)
+            if len(positions) == 0:
+                continue
+            
+            bounds = list(box)
+            bounds[2 * axis + 1] = positions
+            lower = [self._volume(moment, *bounds) for moment in (weight, red, green, blue)]
+            upper = [total - part for total, part in zip(whole, lower)]
+            
+            valid = (lower[0] > 0) & (upper[0] > 0)
+            if not valid.any():
+                continue
+            
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = ((lower[1] ** 2 + lower[2] ** 2 + lower[3] ** 2) / lower[0]
+                         + (upper[1] ** 2 + upper[2] ** 2 + upper[3] ** 2) / upper[0])
+            score = np.where(valid, score, -np.inf)
+            
+            index = int(np.argmax(score))
+            if score[index] > best_score:
+                best_score, best_axis, best_position = float(score[index]), axis, int(positions[index])
+        
+        if best_axis is None:
+            return None
+        
+        first, second = list(box), list(box)
+        first[2 * best_axis + 1] = best_position
+        second[2 * best_axis] = best_position
+        return tuple(first), tuple(second)
+
+QUANTIZERS: Dict[str, Type[Quantizer]] = {
+    quantizer.name: quantizer
+    for quantizer in (KMeansQuantizer, MiniBatchKMeansQuantizer, MedianCutQuantizer, OctreeQuantizer, WuQuantizer)
+}
+
+def create_quantizer(name: str, preset: Optional[str] = None) -> Quantizer:
+    """Instantiate a quantization backend by name; presets tune K-means, other backends ignore them"""
+    try:
+        backend = QUANTIZERS[name]
+    except KeyError:
+        raise ColorProcessingException(
+            f"Unknown quantizer '{name}'. Available: {', '.join(QUANTIZERS)}"
+        ) from None
+    if issubclass(backend, KMeansQuantizer):
+        return backend(preset=preset or DEFAULT_PRESET)
+    if preset is not None:
+        kmeans_preset(preset)
+    return backend()
\ No newline at end of file
@@ -0,0 +1,413 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from domain import ColorPalette, RGBColor, DomainException, QueueFullException
+from infrastructure import ImageRepository, ColorAnalyzer, PaletteCache
+from application import ColorReductionService
+from quantizers import QUANTIZERS, KMEANS_PRESETS, DEFAULT_PRESET, preload_backends
+from colorspaces import METRICS
+from dithering import DITHER_MODES
+from instrumentation import Instrumentation, JsonLinesSink
+
+# Response body and content type
+Response = Tuple[bytes, str]
+
+class LatencyWindow:
+    """Recent latencies of one kind, summarized as percentiles"""
+    
+    def __init__(self, size: int = 1024):
+        self._samples = deque(maxlen=size)
+    
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+    
+    def summary(self) -> Dict[str, float]:
+        if not self._samples:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        samples = np.array(self._samples) * 1000
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2),
+                'max': round(float(samples.max()), 2)}
+
+class ServerMetrics:
+    """Request counters and per-endpoint latency windows (total, queue wait, run)"""
+    
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {'requests': 0, 'errors': 0, 'rejected': 0,
+                         'cache_hits': 0, 'cache_misses': 0, 'coalesced': 0}
+        self._endpoints: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+    
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+    
+    def observe(self, endpoint: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            windows = self._endpoints.setdefault(endpoint, {'count': 0})
+            if kind == 'total':
+                windows['count'] += 1
+            windows.setdefault(kind, LatencyWindow()).add(seconds)
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            endpoints = {
+                endpoint: {kind: (window if kind == 'count' else window.summary())
+                           for kind, window in windows.items()}
+                for endpoint, windows in self._endpoints.items()
+            }
+            return {'uptime_seconds': round(time.time() - self.started, 1), **self.counters,
+                    'latency_ms': endpoints}
+
+class JobQueue:
+    """Bounded FIFO served by a fixed pool of worker threads; identical in-flight jobs share one run"""
+    
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, name: str = "server-worker"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.running = 0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max_pending)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{index}", daemon=True)
+                         for index in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+    
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+    
+    def submit(self, key: str, task: Callable[[], object],
+               on_result: Optional[Callable[[object], None]] = None) -> Tuple[Future, bool]:
+        """Queue a task, or join the identical one already queued or running; True when joined
+        
+        on_result runs on the worker before the key leaves the in-flight table, so a result stored by it
+        is visible to the next identical request whether or not anyone is still waiting for this one.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, True
+            future = Future()
+            future.queued_at = time.perf_counter()
+            try:
+                self._queue.put_nowait((key, task, on_result, future))
+            except queue.Full:
+                raise QueueFullException(f"Job queue is full ({self.max_pending} pending)") from None
+            self._inflight[key] = future
+        return future, False
+    
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            key, task, on_result, future = item
+            started = time.perf_counter()
+            future.queue_seconds = started - future.queued_at
+            with self._lock:
+                self.running += 1
+            try:
+                result = task()
+                if on_result is not None:
+                    on_result(result)
+            except Exception as e:
+                future.run_seconds = time.perf_counter() - started
+                future.set_exception(e)
+            else:
+                future.run_seconds = time.perf_counter() - started
+                future.set_result(result)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self._inflight.pop(key, None)
+    
+    def shutdown(self) -> None:
+        """Finish the queued jobs, then stop the workers"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+class JobServer:
+    """Runs analysis and reduction requests through the job queue, with a cache of finished responses"""
+    
+    JSON = "application/json"
+    PNG = "image/png"
+    ENDPOINTS = ("/analyze", "/reduce/auto", "/reduce/manual")
+    
+    def __init__(self, color_service: ColorReductionService, repository: Optional[ImageRepository] = None,
+                 max_workers: int = 2, max_pending: int = 16, result_cache_mb: float = 256.0,
+                 job_timeout: float = 300.0):
+        self.color_service = color_service
+        self.repository = repository or ImageRepository()
+        self.jobs = JobQueue(max_workers, max_pending)
+        # Encoded responses, keyed by upload digest and parameters; same LRU as palettes and label maps
+        self.results = PaletteCache(max_memory_mb=result_cache_mb)
+        self.job_timeout = job_timeout
+        self.metrics = ServerMetrics()
+    
+    def handle(self, endpoint: str, body: bytes, params: Dict[str, str]) -> Tuple[Response, str]:
+        """Response for a POST endpoint and how it was served: hit, miss or shared"""
+        if endpoint == "/analyze":
+            options = self._analysis_options(params)
+            build = lambda: self._analyze(body, **options)
+            content_type = self.JSON
+        elif endpoint == "/reduce/auto":
+            options = {**self._analysis_options(params), **self._output_options(params)}
+            build = lambda: self._auto_reduce(body, **options)
+            content_type = self.PNG
+        elif endpoint == "/reduce/manual":
+            options = {**self._analysis_options(params, count=False), **self._output_options(params),
+                       'palette': self._palette(params), 'metric': self._choice(params, 'metric', METRICS, "rgb")}
+            build = lambda: self._manual_reduce(body, **options)
+            content_type = self.PNG
+        else:
+            raise ValueError(f"Unknown endpoint {endpoint}")
+        
+        key = self.results.key(endpoint, hashlib.blake2b(body, digest_size=20).hexdigest(),
+                               *sorted(options.items()))
+        cached = self.results.get(key)
+        if cached is not None:
+            self.metrics.count('cache_hits')
+            return (cached.tobytes(), content_type), "hit"
+        
+        future, shared = self.jobs.submit(
+            key, build, on_result=lambda data: self.results.put(key, np.frombuffer(data, dtype=np.uint8)))
+        self.metrics.count('coalesced' if shared else 'cache_misses')
+        try:
+            data = future.result(timeout=self.job_timeout)
+        finally:
+            if future.done():
+                self.metrics.observe(endpoint, 'queue_wait', future.queue_seconds)
+                self.metrics.observe(endpoint, 'run', future.run_seconds)
+        return (data, content_type), "shared" if shared else "miss"
+    
+    def snapshot(self) -> dict:
+        """Queue depth, cache counters and latency percentiles for /metrics"""
+        return {
+            'queue': {'depth': self.jobs.depth, 'capacity': self.jobs.max_pending,
+                      'running': self.jobs.running, 'workers': self.jobs.max_workers},
+            **self.metrics.snapshot(),
+        }
+    
+    def shutdown(self) -> None:
+        self.jobs.shutdown()
+    
+    @staticmethod
+    def _choice(params: Dict[str, str], name: str, choices, default: Optional[str]) -> Optional[str]:
+        value = params.get(name, default)
+        if value is not None and value not in choices:
+            raise ValueError(f"Unknown {name} '{value}'. Available: {', '.join(choices)}")
+        return value
+    
+    @staticmethod
+    def _flag(params: Dict[str, str], name: str) -> bool:
+        return params.get(name, "0").lower() in ("1", "true", "yes")
+    
+    def _analysis_options(self, params: Dict[str, str], count: bool = True) -> dict:
+        options = {
+            'quantizer': self._choice(params, 'quantizer', QUANTIZERS, None),
+            'preset': self._choice(params, 'preset', KMEANS_PRESETS, None),
+        }
+        if count:
+            color_count = int(params.get('colors', 6))
+            if not 1 <= color_count <= 12:
+                raise ValueError("colors must be between 1 and 12")
+            options['color_count'] = color_count
+        return options
+    
+    def _output_options(self, params: Dict[str, str]) -> dict:
+        return {'full_resolution': self._flag(params, 'full_resolution'),
+                'dither': self._choice(params, 'dither', DITHER_MODES, "none")}
+    
+    @staticmethod
+    def _palette(params: Dict[str, str]) -> Tuple[str, ...]:
+        """Filament colors from palette=ff0000,00ff00,... (the leading # is optional)"""
+        entries = [entry for entry in params.get('palette', "").split(',') if entry.strip()]
+        if not entries:
+            raise ValueError("palette needs at least one hex color")
+        return tuple(RGBColor.from_hex(entry).hex for entry in entries)
+    
+    def _analyze(self, body: bytes, color_count: int, quantizer: Optional[str], preset: Optional[str]) -> bytes:
+        image = self.repository.decode(body)
+        palette = self.color_service.analyze_image_colors(image, color_count, quantizer, preset=preset)
+        return json.dumps({'colors': [color.hex for color in palette.colors]}).encode()
+    
+    def _auto_reduce(self, body: bytes, color_count: int, quantizer: Optional[str], preset: Optional[str],
+                     full_resolution: bool, dither: str) -> bytes:
+        image = self.repository.decode(body)
+        result = self.color_service.auto_reduce_colors(image, color_count, full_resolution=full_resolution,
+                                                       quantizer=quantizer, preset=preset, dither=dither)
+        return self.repository.encode(result)
+    
+    def _manual_reduce(self, body: bytes, palette: Tuple[str, ...], metric: str, quantizer: Optional[str],
+                       preset: Optional[str], full_resolution: bool, dither: str) -> bytes:
+        image = self.repository.decode(body)
+        filament_colors = ColorPalette(tuple(RGBColor.from_hex(color) for color in palette))
+        result = self.color_service.manual_reduce_colors(image, filament_colors, full_resolution=full_resolution,
+                                                         quantizer=quantizer, metric=metric, preset=preset,
+                                                         dither=dither)
+        return self.repository.encode(result)
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """POST /analyze, /reduce/auto and /reduce/manual with the image as the body; GET /metrics and /health"""
+    
+    protocol_version = "HTTP/1.1"
+    CHUNK_BYTES = 1024 * 1024
+    
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send_json(HTTPStatus.OK, self.server.job_server.snapshot())
+        elif path == "/health":
+            self._send_json(HTTPStatus.OK, {'status': 'ok'})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {'error': f"Unknown path {path}"})
+    
+    def do_POST(self) -> None:
+        job_server: JobServer = self.server.job_server
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        job_server.metrics.count('requests')
+        if url.path not in JobServer.ENDPOINTS:
+            self._fail(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        if length <= 0:
+            self._fail(HTTPStatus.LENGTH_REQUIRED, "Send the image as the request body with a Content-Length")
+            return
+        if length > self.server.max_upload_bytes:
+            self.close_connection = True
+            self._fail(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Upload larger than {self.server.max_upload_bytes} bytes")
+            return
+        body = self.rfile.read(length)
+        
+        try:
+            (data, content_type), served = job_server.handle(url.path, body, params)
+        except QueueFullException as e:
+            job_server.metrics.count('rejected')
+            self._fail(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': "1"})
+            return
+        except FutureTimeoutError:
+            self._fail(HTTPStatus.GATEWAY_TIMEOUT, f"Job did not finish within {job_server.job_timeout:g} s")
+            return
+        except (DomainException, ValueError) as e:
+            self._fail(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except Exception as e:
+            self._fail(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+        
+        self._send(HTTPStatus.OK, data, content_type, {'X-Cache': served})
+        job_server.metrics.observe(url.path, 'total', time.perf_counter() - started)
+    
+    def _fail(self, status: HTTPStatus, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.server.job_server.metrics.count('errors')
+        self._send_json(status, {'error': message}, headers)
+    
+    def _send_json(self, status: HTTPStatus, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(payload).encode(), JobServer.JSON, headers)
+    
+    def _send(self, status: HTTPStatus, data: bytes, content_type: str,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        """Write the response in chunks so large results start flowing before the last byte is copied"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        view = memoryview(data)
+        for start in range(0, len(view), self.CHUNK_BYTES):
+            self.wfile.write(view[start:start + self.CHUNK_BYTES])
+    
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def create_server(job_server: JobServer, host: str = "127.0.0.1", port: int = 8765,
+                  max_upload_mb: float = 256.0, verbose: bool = False) -> ThreadingHTTPServer:
+    """HTTP server bound to host:port (port 0 picks a free one); serve_forever() runs it"""
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.job_server = job_server
+    server.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+    server.verbose = verbose
+    return server
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="color-reduction-server",
+        description="Local HTTP job server for color analysis and reduction",
+    )
+    parser.add_argument('--host', default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on, 0 for any free port")
+    parser.add_argument('-j', '--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="Jobs processed at the same time")
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help="Jobs waiting beyond the running ones before requests are refused with 503")
+    parser.add_argument('--result-cache-mb', type=float, default=256.0,
+                        help="Memory for finished responses, reused for identical submissions")
+    parser.add_argument('--max-upload-mb', type=float, default=256.0, help="Largest accepted request body")
+    parser.add_argument('--job-timeout', type=float, default=300.0, help="Seconds a request waits for its job")
+    parser.add_argument('-q', '--quantizer', default='kmeans', choices=list(QUANTIZERS),
+                        help="Default quantizer backend (default: kmeans)")
+    parser.add_argument('--preset', default=DEFAULT_PRESET, choices=list(KMEANS_PRESETS),
+                        help=f"Default K-means preset (default: {DEFAULT_PRESET})")
+    parser.add_argument('--cache-dir', type=Path, help="Persist fitted palettes across restarts")
+    parser.add_argument('--trace', type=Path, help="Append per-stage timing records to this JSON lines file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Server entry point; runs until interrupted"""
+    args = build_parser().parse_args(argv)
+    workers = max(1, args.workers)
+    # Share the cores between concurrent jobs instead of every job spawning a full thread pool
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=max(1, (os.cpu_count() or 1) // workers))
+    preload_backends()
+    
+    instrumentation = Instrumentation(JsonLinesSink(args.trace)) if args.trace else None
+    analyzer = ColorAnalyzer(quantizer=args.quantizer, instrumentation=instrumentation, preset=args.preset)
+    service = ColorReductionService(analyzer, palette_cache=PaletteCache(cache_dir=args.cache_dir))
+    job_server = JobServer(service, max_workers=workers, max_pending=max(1, args.queue_size),
+                           result_cache_mb=args.result_cache_mb, job_timeout=args.job_timeout)
+    server = create_server(job_server, args.host, args.port, args.max_upload_mb, args.verbose)
+    
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} with {workers} workers", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        job_server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
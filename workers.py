@@ -0,0 +1,125 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from domain import JobCancelledException
+
+class Job:
+    """Handle to a background job, passed to the task for progress and cancellation"""
+    
+    def __init__(self, job_id: int, events: 'queue.Queue'):
+        self.job_id = job_id
+        self._events = events
+        self._cancelled = threading.Event()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def cancel(self) -> None:
+        """Request cancellation; the task stops at its next progress report"""
+        self._cancelled.set()
+    
+    def report(self, stage: str, fraction: float) -> None:
+        """Publish stage progress from the worker thread and honour cancellation"""
+        if self.cancelled:
+            raise JobCancelledException(f"Job {self.job_id} cancelled")
+        self._events.put((self.job_id, "progress", (stage, fraction)))
+    
+    def publish(self, partial_result: Any) -> None:
+        """Hand an intermediate result (e.g. a preview) to the main thread"""
+        if self.cancelled:
+            raise JobCancelledException(f"Job {self.job_id} cancelled")
+        self._events.put((self.job_id, "partial", partial_result))
+
+class BackgroundWorker:
+    """Runs tasks off the Tk main thread and marshals their events back through root.after"""
+    
+    def __init__(self, root, max_workers: int = 1, poll_interval_ms: int = 50, name: str = "color-worker"):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._events: 'queue.Queue' = queue.Queue()
+        self._handlers = {}
+        self._current: Optional[Job] = None
+        self._next_id = 0
+        self._polling = False
+    
+    @property
+    def busy(self) -> bool:
+        return self._current is not None
+    
+    def submit(self, task: Callable[[Job], Any],
+               on_success: Callable[[Any], None],
+               on_error: Optional[Callable[[Exception], None]] = None,
+               on_progress: Optional[Callable[[str, float], None]] = None,
+               on_partial: Optional[Callable[[Any], None]] = None) -> Job:
+        """Start a task, superseding any running one whose result becomes stale"""
+        self.cancel()
+        
+        self._next_id += 1
+        job = Job(self._next_id, self._events)
+        self._current = job
+        self._handlers[job.job_id] = (on_success, on_error, on_progress, on_partial)
+        
+        def run():
+            try:
+                self._events.put((job.job_id, "success", task(job)))
+            except Exception as e:
+                self._events.put((job.job_id, "error", e))
+        
+        self._executor.submit(run)
+        self._schedule_poll()
+        return job
+    
+    def cancel(self) -> None:
+        """Cancel the running job; its pending events are discarded"""
+        if self._current is not None:
+            self._current.cancel()
+            self._handlers.pop(self._current.job_id, None)
+            self._current = None
+    
+    def shutdown(self) -> None:
+        """Cancel outstanding work and stop accepting new jobs"""
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _schedule_poll(self) -> None:
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval_ms, self._poll)
+    
+    def _poll(self) -> None:
+        """Dispatch queued worker events on the main thread"""
+        self._polling = False
+        while True:
+            try:
+                job_id, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            
+            handlers = self._handlers.get(job_id)
+            if handlers is None:
+                continue  # Stale or cancelled job
+            
+            on_success, on_error, on_progress, on_partial = handlers
+            if kind == "progress":
+                if on_progress is not None:
+                    on_progress(*payload)
+                continue
+            if kind == "partial":
+                if on_partial is not None:
+                    on_partial(payload)
+                continue
+            
+            self._handlers.pop(job_id, None)
+            if self._current is not None and self._current.job_id == job_id:
+                self._current = None
+            if kind == "success":
+                on_success(payload)
+            elif not isinstance(payload, JobCancelledException) and on_error is not None:
+                on_error(payload)
+        
+        if self._handlers:
+            self._schedule_poll()
\ No newline at end of file